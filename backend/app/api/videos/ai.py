@@ -966,9 +966,33 @@ async def generate_video_summary(
     if current_user and video.uploader_id != current_user.id and current_user.role != "admin":
         raise ForbiddenException("只有视频上传者或管理员可以生成摘要")
     
+    # 同一视频的摘要任务进行中时不重复启动（每次生成都要占用数秒的 LLM 推理）
+    status_key = f"summary:status:{video_id}"
+    lock_ttl_seconds = 30 * 60
+    try:
+        acquired = redis_service.redis.set(status_key, "running", nx=True, ex=lock_ttl_seconds)
+    except Exception as exc:
+        logger.warning(f"Failed to set summary status: {status_key}, error={exc}")
+        acquired = True
+    if not acquired:
+        return success_response(
+            data={"video_id": video_id, "status": "running"},
+            message="摘要生成任务正在进行中，请稍后查询"
+        )
+    
     # 异步生成摘要（避免阻塞）
     from app.services.video.summary_service import summary_service
-    background_tasks.add_task(summary_service.generate_summary, video_id)
+    
+    async def generate_and_release():
+        try:
+            await summary_service.generate_summary(video_id)
+        finally:
+            try:
+                redis_service.redis.delete(status_key)
+            except Exception as exc:
+                logger.warning(f"Failed to clear summary status: {status_key}, error={exc}")
+    
+    background_tasks.add_task(generate_and_release)
     
     return success_response(
         data={},
@@ -66,6 +66,7 @@ class Settings(BaseSettings):
     LLM_BASE_URL: str = "https://open.bigmodel.cn/api/paas/v4"  # 智谱GLM API地址
     LLM_MODEL: str = "glm-4-flash"  # 文本模型：免费用户并发限制200次
     SUMMARY_MODEL: str = "glm-4-plus"  # Summary/knowledge extraction model
+    SUMMARY_FUSED_PROMPT: bool = True  # 摘要和知识点是否合并为一次 LLM 请求（未返回可用 JSON 时回退到分开请求）
     
     # 云端图像识别模型配置（用于视频抽帧审核）
     LLM_VISION_API_KEY: str = ""  # 图像识别API密钥，可选（与LLM_API_KEY相同）
@@ -211,6 +212,18 @@ class Settings(BaseSettings):
     VIDEO_ORIGINAL_DIR: str = "./storage/videos/originals"  # 原始上传视频
     VIDEO_HLS_DIR: str = "./storage/videos/hls"  # HLS转码输出
     
+    # 视频大纲缓存（同一字幕 + 同一模型 + 同一提示词版本时直接复用 LLM 结果）
+    OUTLINE_CACHE_ENABLED: bool = True  # 是否启用大纲缓存
+    OUTLINE_CACHE_DIR: str = "./storage/cache/outline"  # 大纲缓存目录
+    OUTLINE_LLM_CACHE_ENABLED: bool = True  # 是否缓存单次 LLM 调用的响应（键：模型 + 采样参数 + 完整消息）
+    OUTLINE_LLM_CACHE_DIR: str = "./storage/cache/outline_llm"  # LLM 响应缓存目录
+    OUTLINE_JSON_MODE: bool = True  # 大纲请求是否携带 response_format=json_object（服务端不支持时关闭）
+    OUTLINE_LLM_STREAM: bool = True  # 大纲请求是否使用流式响应（JSON 闭合后提前断开，模型随之停止生成）
+    OUTLINE_BATCH_SEGMENTS: bool = True  # 长视频是否优先把所有分段合并为一次请求（超出上下文预算或失败时逐段请求）
+    OUTLINE_LLM_CONTEXT_TOKENS: int = 32000  # 云端大纲模型上下文长度（token），决定批量分段模式能容纳多少字幕
+    OUTLINE_LOCAL_LLM_CONTEXT_TOKENS: int = 2048  # 本地模型实际生效的上下文长度（与 Ollama 的 num_ctx / OLLAMA_CONTEXT_LENGTH 保持一致），放不下的批量请求不发给本地模型
+    OUTLINE_SEGMENT_CONCURRENCY: int = 3  # 长视频分段并发请求数（本地 Ollama 需同时设置 OLLAMA_NUM_PARALLEL >= 该值、OLLAMA_MAX_LOADED_MODELS=1）
+    
     MAX_UPLOAD_SIZE: int = 2147483648  # 2GB
     CHUNK_SIZE: int = 5242880  # 分片大小：5MB
     UPLOAD_SESSION_EXPIRE: int = 604800  # 上传会话过期时间：7天（秒）
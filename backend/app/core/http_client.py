@@ -0,0 +1,90 @@
+"""
+HTTP 客户端连接池
+
+这个文件的作用：
+1. 提供进程内共享的 httpx.AsyncClient（复用 TCP/TLS 连接）- 相当于 Java 的 HttpClient 连接池
+2. 应用关闭时统一释放连接
+
+云端 LLM 接口启用 HTTP/2，多个并发请求复用同一条连接（多路复用 + 头部压缩）。
+本地 LLM（Ollama）使用独立的 HTTP/1.1 keep-alive 连接池，不读取代理环境变量。
+"""
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 云端客户端默认超时（单次请求可通过 post(timeout=...) 覆盖）
+CLOUD_DEFAULT_TIMEOUT = 60.0
+
+# 本地客户端默认超时：连接本机服务应很快失败，推理本身可能较慢
+LOCAL_DEFAULT_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+
+_cloud_client: Optional[httpx.AsyncClient] = None
+_local_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """h2 未安装时 httpx 无法启用 HTTP/2，回退到 HTTP/1.1"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_cloud_http_client() -> httpx.AsyncClient:
+    """
+    获取云端 LLM 共享客户端（懒加载）
+
+    使用方式：
+    client = get_cloud_http_client()
+    response = await client.post(url, json=payload, headers=headers, timeout=60.0)
+    """
+    global _cloud_client
+    if _cloud_client is None or _cloud_client.is_closed:
+        http2 = _http2_available()
+        if not http2:
+            logger.warning("h2 未安装，云端 HTTP 客户端回退到 HTTP/1.1")
+        _cloud_client = httpx.AsyncClient(
+            http2=http2,
+            timeout=CLOUD_DEFAULT_TIMEOUT,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _cloud_client
+
+
+def get_local_http_client() -> httpx.AsyncClient:
+    """
+    获取本地 LLM（Ollama）共享客户端（懒加载）
+
+    trust_env=False：本地服务不走系统代理
+    
+    使用方式：
+    client = get_local_http_client()
+    response = await client.post(url, json=payload, timeout=120.0)
+    """
+    global _local_client
+    if _local_client is None or _local_client.is_closed:
+        _local_client = httpx.AsyncClient(
+            timeout=LOCAL_DEFAULT_TIMEOUT,
+            trust_env=False,
+            limits=httpx.Limits(
+                max_connections=16,
+                max_keepalive_connections=8,
+                keepalive_expiry=60.0,
+            ),
+        )
+    return _local_client
+
+
+async def close_http_clients() -> None:
+    """关闭所有共享客户端（应用关闭时调用）"""
+    global _cloud_client, _local_client
+    if _cloud_client is not None:
+        await _cloud_client.aclose()
+        _cloud_client = None
+    if _local_client is not None:
+        await _local_client.aclose()
+        _local_client = None
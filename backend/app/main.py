@@ -193,6 +193,13 @@ async def shutdown_event():
         await llm_service.stop_analysis_queue()
     except Exception as e:
         logger.debug(f"AI 分析队列关闭失败（可忽略）: {e}")
+
+    # 释放共享 HTTP 连接池
+    try:
+        from app.core.http_client import close_http_clients
+        await close_http_clients()
+    except Exception as e:
+        logger.debug(f"HTTP 连接池关闭失败（可忽略）: {e}")
     
     # GPU 管理：仅在可能使用本地模型且启用 GPU 管理时执行
     llm_mode = getattr(settings, "LLM_MODE", "hybrid").lower()
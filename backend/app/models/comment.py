@@ -48,6 +48,7 @@ class Comment(Base):
         Index('idx_user_id', 'user_id'),  # 查询用户的评论
         Index('idx_created_at', 'created_at'),  # 按时间排序
         Index('idx_like_count', 'like_count'),  # 按点赞数排序
+        Index('idx_video_deleted_like', 'video_id', 'is_deleted', 'like_count'),  # 摘要取视频点赞最多的前 N 条评论（反向扫描索引，无需排序）
     )
     
     def __repr__(self):
@@ -35,4 +35,6 @@ class Danmaku(Base):
     # 索引：通常会根据视频ID和时间查询
     __table_args__ = (
         Index('idx_video_time', 'video_id', 'video_time'),
+        # 摘要取前 N 条未删除弹幕：WHERE video_id, is_deleted ORDER BY video_time LIMIT N 可直接按索引顺序读取
+        Index('idx_video_deleted_time', 'video_id', 'is_deleted', 'video_time'),
     )
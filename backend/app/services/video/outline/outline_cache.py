@@ -0,0 +1,130 @@
+"""
+大纲结果缓存模块
+
+职责：按内容寻址缓存 LLM 结果，重复处理时跳过 LLM 调用
+
+两级缓存：
+1. 大纲缓存：缓存键 = sha256(字幕文件内容哈希, LLM_MODE, 云端模型, 本地模型, 提示词版本)，
+   命中后仍由调用方执行合并与时间校验，保证输出与当前字幕一致。
+2. 响应缓存：缓存键 = sha256(模型, temperature, max_tokens, 系统消息, 用户消息)，
+   缓存单次 LLM 调用的原始响应文本（分段模式下某些段已缓存时只需请求其余段）。
+
+各字段带长度前缀拼接，避免不同字段组合拼出相同的字节串。
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from app.core.config import settings
+from app.utils.hash_utils import calculate_file_hash
+from app.utils.timezone_utils import utc_now
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_parts(*parts: bytes) -> str:
+    """对多个字段做带长度前缀的 sha256"""
+    hash_obj = hashlib.sha256()
+    for part in parts:
+        hash_obj.update(len(part).to_bytes(8, 'little'))
+        hash_obj.update(part)
+    return hash_obj.hexdigest()
+
+
+def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+    """读取缓存文件，不存在或损坏时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"[OutlineCache] 读取缓存失败，忽略: {path} ({e})")
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _write_json_atomic(path: Path, data: Dict[str, Any]) -> None:
+    """写入缓存（先写临时文件再原子替换，避免并发读到半个文件）"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': utc_now().isoformat(), **data}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"[OutlineCache] 写入缓存失败: {path} ({e})")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
+
+def build_outline_cache_key(subtitle_path: str, prompt_version: str) -> str:
+    """根据字幕文件内容、模型配置和提示词版本（outline_llm.OUTLINE_PROMPT_VERSION）计算缓存键"""
+    return _hash_parts(
+        b"outline",
+        calculate_file_hash(subtitle_path).encode(),
+        settings.LLM_MODE.encode(),
+        settings.LLM_MODEL.encode(),
+        settings.LOCAL_LLM_MODEL.encode(),
+        prompt_version.encode(),
+    )
+
+
+def _cache_path(key: str) -> Path:
+    return Path(settings.OUTLINE_CACHE_DIR) / f"outline_{key}.json"
+
+
+def load_cached_outline(key: str) -> Optional[List[Dict[str, Any]]]:
+    """读取缓存的大纲，未命中或缓存损坏时返回 None"""
+    data = _read_json(_cache_path(key))
+    outline = data.get('outline') if data else None
+    if not isinstance(outline, list):
+        return None
+    return outline
+
+
+def save_cached_outline(key: str, outline: List[Dict[str, Any]]) -> None:
+    """写入大纲缓存"""
+    _write_json_atomic(_cache_path(key), {'outline': outline})
+
+
+def build_response_cache_key(
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    system_prompt: str,
+    prompt: str
+) -> str:
+    """根据模型、采样参数和完整消息计算单次 LLM 调用的缓存键"""
+    return _hash_parts(
+        b"outline_llm",
+        model.encode(),
+        repr(float(temperature)).encode(),
+        str(int(max_tokens)).encode(),
+        system_prompt.encode(),
+        prompt.encode(),
+    )
+
+
+def _response_cache_path(key: str) -> Path:
+    # 按键前两位分目录，避免单个目录下文件过多
+    return Path(settings.OUTLINE_LLM_CACHE_DIR) / key[:2] / f"{key}.json"
+
+
+def load_cached_response(key: str) -> Optional[str]:
+    """读取缓存的 LLM 响应文本，未命中时返回 None"""
+    data = _read_json(_response_cache_path(key))
+    response_text = data.get('response') if data else None
+    if not isinstance(response_text, str) or not response_text:
+        return None
+    return response_text
+
+
+def save_cached_response(key: str, response_text: str) -> None:
+    """写入 LLM 响应缓存"""
+    _write_json_atomic(_response_cache_path(key), {'response': response_text})
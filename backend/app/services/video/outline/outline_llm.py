@@ -5,11 +5,23 @@
 """
 import logging
 import asyncio
-from typing import List, Optional, Dict, Any, Callable
+import random
+import re
+from bisect import bisect_left
+from typing import List, Optional, Dict, Any, Callable, Tuple, Awaitable
 
 from app.core.config import settings
+from app.core.http_client import get_cloud_http_client, get_local_http_client
 from app.services.video.subtitle_parser import SubtitleParser
-from app.services.video.outline.outline_parser import parse_llm_response
+from app.services.video.outline.outline_parser import parse_llm_response, parse_batched_llm_response
+from app.services.video.outline.outline_validator import coerce_start_time
+from app.services.video.outline.outline_cache import (
+    build_response_cache_key,
+    load_cached_response,
+    save_cached_response,
+)
+from app.utils.json_utils import fast_json_dumps, fast_json_loads
+from app.utils.token_utils import estimate_tokens, max_chars_for_tokens, truncate_to_token_budget
 import httpx
 
 logger = logging.getLogger(__name__)
@@ -21,10 +33,225 @@ logger = logging.getLogger(__name__)
 _llm_semaphore = asyncio.Semaphore(10)  # 字幕分点并发数：10（远低于200的限制）
 
 # 请求冷却时间：避免频繁调用 GPU，减少电流滋滋声
-_last_request_time = None
 _request_cooldown = 2.0  # 请求之间的最小间隔（秒），给 GPU 足够的冷却时间
 
 
+class _AsyncRateLimiter:
+    """
+    请求节流：保证相邻两次 acquire 返回的间隔不小于 interval
+    
+    每个调用方在锁内预约自己的发车时间，锁外等待，等待期间不占用并发信号量
+    """
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_time = 0.0
+    
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            wait_time = max(0.0, self._next_time - now)
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            logger.info(f"[OutlineLLM] 请求冷却中，等待 {wait_time:.2f} 秒...")
+            await asyncio.sleep(wait_time)
+
+
+_request_rate_limiter = _AsyncRateLimiter(_request_cooldown)
+
+# 系统提示词：云端/本地调用共用，模块加载时构建一次（约定只读，不要修改）
+_SYSTEM_PROMPT = (
+    "你是一个专业的视频内容分析助手，擅长从字幕中提取视频章节大纲。\n\n"
+    "**重要：你必须只返回一个 JSON 对象，章节数组放在 \"outline\" 字段中，"
+    "不要包含任何 Markdown 代码块标记（不要使用 ```json 或 ```）。\n\n"
+    "JSON 格式示例：\n"
+    "{\n"
+    "  \"outline\": [\n"
+    "    {\n"
+    "      \"title\": \"章节标题\",\n"
+    "      \"start_time\": 0,\n"
+    "      \"description\": \"章节描述\",\n"
+    "      \"key_points\": [\"关键点1\", \"关键点2\"]\n"
+    "    }\n"
+    "  ]\n"
+    "}\n\n"
+    "注意：\n"
+    "- 必须使用英文字段名（outline, title, start_time, description, key_points）\n"
+    "- start_time 必须是数字，不是字符串\n"
+    "- 不要使用中文字段名（如\"开始时间\"）\n"
+    "- 不要包含 Markdown 标记"
+)
+_SYSTEM_MESSAGE = {"role": "system", "content": _SYSTEM_PROMPT}
+
+# 任务说明放在系统消息中，对所有视频/所有分段逐字节相同（稳定前缀），
+# 本地 Ollama / 云端都可以复用这部分的 KV 缓存；
+# 每次变化的参数（时长、段号、关键点数量）和字幕文本放在用户消息末尾。
+_SINGLE_TASK_PROMPT = """任务：分析视频字幕内容，提取视频的主要章节/主题大纲，并为每个章节生成关键知识点/内容点。
+用户消息会先给出本次视频的参数（视频总时长、建议章节数、各章节的时间范围、关键点数量），最后给出完整字幕。
+
+**关键要求（必须严格遵守）：**
+1. 你必须确保大纲覆盖从开始（0秒）到结束（视频总时长）的整个视频
+2. **章节数量：按参数中的建议章节数生成**（每3-5分钟一个章节），确保覆盖整个视频
+3. **时间分布：章节时间点必须均匀分布在整个视频中**
+   - 第一个章节、中间章节、最后一个章节的 start_time 必须分别落在参数给出的范围内
+   - 最后一个章节不能是最后一秒，应该提前5-15%结束
+4. **禁止只生成前几分钟的大纲**，必须覆盖到视频结束时间
+
+**每个章节格式要求：**
+- **title**: 章节标题（必须基于字幕内容生成，不能使用"开始"、"中间章节"、"最后章节"等通用名称。标题应该概括该章节的核心主题，10字以内，简洁明了）
+- **start_time**: 开始时间（秒，必须从字幕内容中准确匹配对应的时间点，不能随意猜测，必须覆盖 0 到视频总时长）
+- **description**: 章节简要描述（20-50字，必须基于字幕内容，准确概括该章节的主要内容，不能随意编造）
+- **key_points**: 关键知识点/内容点列表（每个章节的关键点数和整个视频的关键点总数见参数。每个关键点10-20字，必须基于字幕内容，不能随意编造）
+
+**关键点数量规则（重要）：**
+- 视频时长 ≤ 3分钟：每个章节1-2个关键点
+- 视频时长 ≤ 15分钟：每个章节2-3个关键点（11分钟视频应该有4-5个章节，每个章节2-3个关键点，总共8-15个关键点）
+- 视频时长 ≤ 30分钟：每个章节3-4个关键点
+- 视频时长 > 30分钟：每个章节4-5个关键点
+
+**注意：关键点数量 = 章节数量 × 每个章节的关键点数。例如11分钟视频有4-5个章节，每个2-3个关键点，总共应该有8-15个关键点。**
+
+**输出要求：**
+- **必须返回严格的 JSON 对象，章节数组放在 "outline" 字段中**，格式如下：
+{
+    "outline": [
+        {
+            "title": "章节标题",
+            "start_time": 0,
+            "description": "章节描述",
+            "key_points": ["关键点1", "关键点2"]
+        },
+        {
+            "title": "下一个章节标题",
+            "start_time": 180,
+            "description": "章节描述",
+            "key_points": ["关键点1", "关键点2"]
+        }
+    ]
+}
+- **不要包含 Markdown 代码块标记（不要使用 ```json 或 ```）**
+- **不要使用中文字段名（如"开始时间"），必须使用英文字段名（"start_time"）**
+- start_time 必须是数字类型，不是字符串
+- start_time 必须从字幕内容中准确匹配，不能随意猜测
+- **最后一个章节的 start_time 必须在参数给出的范围内（不能是最后一秒，应该提前5-15%结束，确保有实际内容）**
+- 标题、描述和关键点都必须基于字幕内容，不能随意编造"""
+
+_SEGMENT_TASK_PROMPT = """任务：分析视频字幕片段，提取该片段的章节/主题大纲。
+用户消息会先给出本片段的参数（段号、时间范围、关键点数量），最后给出该片段的字幕。
+
+**关键要求：**
+1. 识别该片段的主要主题和章节（2-5 个章节，根据片段长度调整）
+2. **标题要求**：章节标题必须基于字幕内容生成，不能使用"开始"、"中间章节"、"最后章节"等通用名称。标题应该概括该章节的核心主题，10字以内，简洁明了
+3. **描述要求**：章节简要描述必须基于字幕内容，准确概括该章节的主要内容，不能随意编造
+4. **关键点要求**：关键知识点/内容点必须基于字幕内容，每个章节的关键点数见参数，每个10-20字，不能随意编造
+
+**每个章节格式：**
+- title: 章节标题（基于字幕内容，10字以内，不能使用通用名称）
+- start_time: 开始时间（秒，必须在参数给出的片段时间范围内，从字幕中准确匹配）
+- description: 章节简要描述（20-50字，基于字幕内容）
+- key_points: 关键知识点/内容点列表（要点数见参数，每个10-20字，基于字幕内容）
+
+**输出要求：**
+- **必须返回严格的 JSON 对象，章节数组放在 "outline" 字段中**，格式如下（start_time 取片段时间范围内的值）：
+{
+    "outline": [
+        {
+            "title": "章节标题",
+            "start_time": 600,
+            "description": "章节描述",
+            "key_points": ["关键点1", "关键点2"]
+        }
+    ]
+}
+- **不要包含 Markdown 代码块标记（不要使用 ```json 或 ```）**
+- **不要使用中文字段名（如"开始时间"），必须使用英文字段名（"start_time"）**
+- start_time 必须是数字类型，不是字符串
+- start_time 必须准确，不能超出片段时间范围
+- 标题、描述和关键点都必须基于字幕内容，不能随意编造"""
+
+_BATCH_TASK_PROMPT = """你是一个专业的视频内容分析助手，擅长从字幕中提取视频章节大纲。
+
+任务：用户消息中包含同一个视频按时间切分的多个字幕片段，每个片段以一行
+=== 第 N 段：开始秒-结束秒（约 M 分钟），关键点：每个章节 K 个 ===
+开头，后面是该片段的字幕。请为每个片段分别提取章节大纲。
+
+**关键要求：**
+1. 每个片段识别 2-5 个章节（根据片段长度调整）
+2. **标题要求**：章节标题必须基于字幕内容生成，不能使用"开始"、"中间章节"、"最后章节"等通用名称，10字以内
+3. **描述要求**：20-50字，基于字幕内容，准确概括该章节的主要内容，不能随意编造
+4. **关键点要求**：每个章节的关键点数见该片段的标题行，每个10-20字，基于字幕内容
+5. start_time 必须在该片段的时间范围内，从字幕中准确匹配
+
+**输出要求：**
+- **必须返回严格的 JSON 对象，"segments" 数组按片段顺序为每个片段放一个章节数组，数组个数必须等于片段数**，格式如下：
+{
+    "segments": [
+        [
+            {
+                "title": "章节标题",
+                "start_time": 0,
+                "description": "章节描述",
+                "key_points": ["关键点1", "关键点2"]
+            }
+        ],
+        [
+            {
+                "title": "章节标题",
+                "start_time": 600,
+                "description": "章节描述",
+                "key_points": ["关键点1", "关键点2"]
+            }
+        ]
+    ]
+}
+- **不要包含 Markdown 代码块标记（不要使用 ```json 或 ```）**
+- 必须使用英文字段名（segments, title, start_time, description, key_points），不要使用中文字段名
+- start_time 必须是数字类型，不是字符串
+- 标题、描述和关键点都必须基于字幕内容，不能随意编造"""
+
+_SINGLE_SYSTEM_MESSAGE = {"role": "system", "content": f"{_SYSTEM_PROMPT}\n\n{_SINGLE_TASK_PROMPT}"}
+_SEGMENT_SYSTEM_MESSAGE = {"role": "system", "content": f"{_SYSTEM_PROMPT}\n\n{_SEGMENT_TASK_PROMPT}"}
+_BATCH_SYSTEM_MESSAGE = {"role": "system", "content": _BATCH_TASK_PROMPT}
+
+# 发送给模型的字幕文本 token 预算（估算值，见 app.utils.token_utils）
+SINGLE_PASS_TOKEN_BUDGET = 8000  # 单次处理模式：全文超过该预算则分段处理
+SEGMENT_TOKEN_BUDGET = 6000  # 分段处理模式的每一段
+
+# 采样参数（同时参与 LLM 响应缓存键）
+_OUTLINE_TEMPERATURE = 0.3
+_OUTLINE_MAX_TOKENS = 3000  # 输出 token 上限的上界
+
+# 按章节数估算输出 token 上限：JSON 外壳 + 每个章节（标题、20-50字描述、若干10-20字关键点及字段名）
+# 生成的 token 越少解码越快，上限只需略大于实际输出
+_OUTPUT_BASE_TOKENS = 120
+_OUTPUT_TOKENS_PER_CHAPTER = 200
+_SEGMENT_MAX_CHAPTERS = 5  # 分段提示词要求每段 2-5 个章节
+
+# 批量分段模式：所有分段放在一次请求中，每段预留的输出 token 数；
+# 上下文中为系统消息等固定内容预留的 token 数
+_BATCH_OUTPUT_TOKENS_PER_SEGMENT = 600
+_BATCH_CONTEXT_RESERVED_TOKENS = 2000
+
+# 可重试的 HTTP 状态码（超时 / 限流 / 服务端临时错误）及最大尝试次数（含首次请求）
+_RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+_MAX_REQUEST_ATTEMPTS = 3
+
+# 请求体由 fast_json_dumps 序列化后以 content 发送，需显式声明类型
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# JSON 模式：服务端约束解码只输出合法 JSON 对象（OpenAI 兼容接口，智谱 GLM / Ollama 均支持），
+# 解析时一次 json.loads 即可，正则回退链只在异常情况下触发
+_JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+# 流式响应中顶层 JSON 之前允许出现的内容：空白和代码块开头标记（```json）
+_JSON_PREAMBLE_RE = re.compile(r'\s*(?:```(?:json)?\s*)?', re.IGNORECASE)
+
+# 提示词版本：修改系统提示词或用户提示词模板时递增，使旧的大纲缓存失效
+OUTLINE_PROMPT_VERSION = "5"
+
+
 def split_subtitles_by_time(
     subtitles: List[Dict[str, Any]],
     segment_duration: int = 600
@@ -42,6 +269,28 @@ def split_subtitles_by_time(
     if not subtitles:
         return []
     
+    starts = [subtitle.get('start_time', 0) for subtitle in subtitles]
+    if starts != sorted(starts):
+        # 字幕未按时间排序（极少见）：逐条扫描
+        return _split_subtitles_sequential(subtitles, segment_duration)
+    
+    # 开始时间有序：每段用二分查找定位下一段的第一条字幕（开始时间 >= 本段开始 + segment_duration）
+    segments = []
+    begin = 0
+    total = len(subtitles)
+    while begin < total:
+        end = bisect_left(starts, starts[begin] + segment_duration, begin + 1)
+        segments.append(subtitles[begin:end])
+        begin = end
+    
+    return segments
+
+
+def _split_subtitles_sequential(
+    subtitles: List[Dict[str, Any]],
+    segment_duration: int
+) -> List[List[Dict[str, Any]]]:
+    """逐条扫描分段（字幕开始时间无序时使用，分段规则与 split_subtitles_by_time 相同）"""
     segments = []
     current_segment = []
     segment_start_time = subtitles[0].get('start_time', 0)
@@ -65,11 +314,48 @@ def split_subtitles_by_time(
     return segments
 
 
+def clamp_to_segment_range(
+    segment_outline: List[Dict[str, Any]],
+    segment_start_time: float,
+    segment_end_time: float
+) -> None:
+    """
+    将超出片段时间范围的章节调整为片段开始时间（原地修改）
+    
+    只在确有章节被调整时输出一条汇总警告，避免逐条刷日志
+    """
+    adjusted = []
+    for item in segment_outline:
+        start_time = coerce_start_time(item.get('start_time', 0))
+        if not segment_start_time <= start_time <= segment_end_time:
+            adjusted.append(start_time)
+            item['start_time'] = segment_start_time
+    
+    if adjusted:
+        logger.warning(
+            f"[OutlineLLM] {len(adjusted)} 个章节时间超出片段范围 "
+            f"({segment_start_time:.1f}s - {segment_end_time:.1f}s)，已调整为片段开始时间: "
+            + ", ".join(f"{t:.1f}s" for t in adjusted)
+        )
+
+
+def _outline_max_tokens(chapter_count: int) -> int:
+    """按章节数估算输出 token 上限（不超过 _OUTLINE_MAX_TOKENS）"""
+    return min(_OUTLINE_MAX_TOKENS, _OUTPUT_BASE_TOKENS + chapter_count * _OUTPUT_TOKENS_PER_CHAPTER)
+
+
+def get_video_duration(subtitles: List[Dict[str, Any]]) -> float:
+    """视频总时长（秒）：取最后一条字幕的结束时间，没有字幕时为 0"""
+    if not subtitles:
+        return 0
+    return subtitles[-1].get('end_time', 0)
+
+
 async def llm_extract_outline(
     full_text: str,
     subtitles: List[Dict[str, Any]],
     progress_callback: Optional[Callable[[int, str], None]] = None
-) -> List[Dict[str, Any]]:
+) -> Tuple[List[Dict[str, Any]], bool]:
     """
     使用 LLM 提取大纲（支持长视频分段处理）
     
@@ -78,26 +364,25 @@ async def llm_extract_outline(
         subtitles: 字幕条目列表（包含时间信息）
         
     Returns:
-        List[Dict]: 大纲列表，每个条目包含标题、时间、描述和关键点
+        (大纲列表, 是否完整)：大纲每个条目包含标题、时间、描述和关键点；
+        分段模式下有分段没有得到章节时结果不完整，调用方不应长期缓存不完整的结果
     """
-    # 计算视频总时长
-    video_duration = 0
-    if subtitles:
-        last_subtitle = subtitles[-1]
-        video_duration = last_subtitle.get('end_time', 0)
+    # 计算视频总时长（只算一次，单次处理模式直接复用）
+    video_duration = get_video_duration(subtitles)
     
     logger.info(f"[OutlineLLM] 视频总时长: {video_duration:.1f}秒，字幕文本长度: {len(full_text)} 字符")
     
-    # 如果视频较短（<15分钟）或文本较短（<8000字符），直接处理
-    max_text_length = 8000  # 单次处理的最大文本长度
+    # 如果视频较短（<15分钟）且文本不超过单次处理的 token 预算，直接处理
+    # （按估算 token 数判断，中英文字幕按实际输入规模一致对待）
     max_duration = 900  # 15分钟
     
-    if len(full_text) <= max_text_length and video_duration <= max_duration:
+    if estimate_tokens(full_text) <= SINGLE_PASS_TOKEN_BUDGET and video_duration <= max_duration:
         # 短视频，直接处理
         logger.info("[OutlineLLM] 视频较短，使用单次处理模式")
         if progress_callback:
             await progress_callback(30, "正在调用 AI 模型生成大纲...")
-        return await llm_extract_outline_single(full_text, subtitles, progress_callback)
+        outline = await llm_extract_outline_single(full_text, subtitles, progress_callback, video_duration)
+        return outline, bool(outline)
     else:
         # 长视频，分段处理
         logger.info(f"[OutlineLLM] 视频较长，使用分段处理模式（每段约10分钟）")
@@ -109,20 +394,27 @@ async def llm_extract_outline(
 async def llm_extract_outline_single(
     full_text: str,
     subtitles: List[Dict[str, Any]],
-    progress_callback: Optional[Callable[[int, str], None]] = None
+    progress_callback: Optional[Callable[[int, str], None]] = None,
+    video_duration: Optional[float] = None
 ) -> List[Dict[str, Any]]:
-    """单次处理模式（适用于短视频）"""
-    # 限制输入文本长度，但尽量保留更多内容
-    max_input_length = 8000
-    if len(full_text) > max_input_length:
-        logger.warning(f"[OutlineLLM] 文本过长 ({len(full_text)} 字符)，截取前 {max_input_length} 字符")
-        full_text = full_text[:max_input_length]
+    """
+    单次处理模式（适用于短视频）
+    
+    video_duration: 视频总时长（秒），调用方已计算时传入，否则由字幕计算
+    """
+    # 限制输入文本长度（按估算 token 数），但尽量保留更多内容
+    max_input_tokens = SINGLE_PASS_TOKEN_BUDGET
+    truncated_text = truncate_to_token_budget(full_text, max_input_tokens)
+    if len(truncated_text) < len(full_text):
+        logger.warning(
+            f"[OutlineLLM] 文本过长 (约 {estimate_tokens(full_text)} tokens)，"
+            f"截取前 {len(truncated_text)} 字符（约 {max_input_tokens} tokens）"
+        )
+        full_text = truncated_text
     
     # 计算视频时长（秒）
-    video_duration = 0
-    if subtitles:
-        last_subtitle = subtitles[-1]
-        video_duration = last_subtitle.get('end_time', 0)
+    if video_duration is None:
+        video_duration = get_video_duration(subtitles)
     
     # 根据视频时长估算章节数量（每3-5分钟一个章节）
     estimated_chapters = max(3, int(video_duration / 180))  # 每3分钟一个章节，最少3个
@@ -143,196 +435,458 @@ async def llm_extract_outline_single(
         key_points_per_chapter = "4-5个"
         total_key_points = "15-20个"
     
-    prompt = f"""请分析以下视频字幕内容，提取视频的主要章节/主题大纲，并为每个章节生成关键知识点/内容点。
+    # 用户消息：参数在前、字幕在最后（任务说明在系统消息中）
+    prompt = f"""参数：
+- 视频总时长：{int(video_duration / 60)} 分钟（{int(video_duration)} 秒）
+- 建议章节数：{estimated_chapters} 个
+- 第一个章节 start_time：0-{int(video_duration * 0.2)}秒
+- 中间章节 start_time：均匀分布在 {int(video_duration * 0.2)}-{int(video_duration * 0.8)}秒
+- 最后一个章节 start_time：{int(video_duration * 0.85)}-{int(video_duration * 0.95)}秒
+- 关键点：每个章节 {key_points_per_chapter}，整个视频总共约 {total_key_points}
 
-**关键要求（必须严格遵守）：**
-1. **视频总时长：{int(video_duration / 60)} 分钟（{int(video_duration)} 秒）**，你必须确保大纲覆盖从开始（0秒）到结束（{int(video_duration)}秒）的整个视频
-2. **章节数量：建议生成 {estimated_chapters} 个章节**（每3-5分钟一个章节），确保覆盖整个视频
-3. **时间分布：章节时间点必须均匀分布在整个视频中**
-   - 第一个章节：0-{int(video_duration * 0.2)}秒
-   - 中间章节：均匀分布在 {int(video_duration * 0.2)}-{int(video_duration * 0.8)}秒
-   - 最后一个章节：必须在 {int(video_duration * 0.85)}-{int(video_duration * 0.95)}秒之间（不能是最后一秒，应该提前5-15%结束）
-4. **禁止只生成前几分钟的大纲**，必须覆盖到视频结束时间（{int(video_duration)}秒）
-
-**每个章节格式要求：**
-- **title**: 章节标题（必须基于字幕内容生成，不能使用"开始"、"中间章节"、"最后章节"等通用名称。标题应该概括该章节的核心主题，10字以内，简洁明了）
-- **start_time**: 开始时间（秒，必须从字幕内容中准确匹配对应的时间点，不能随意猜测，必须覆盖 0 到 {int(video_duration)} 秒）
-- **description**: 章节简要描述（20-50字，必须基于字幕内容，准确概括该章节的主要内容，不能随意编造）
-- **key_points**: 关键知识点/内容点列表（每个章节 {key_points_per_chapter} 关键点，整个视频总共约 {total_key_points} 关键点。每个关键点10-20字，必须基于字幕内容，不能随意编造）
+请返回 {{"outline": [...]}} 格式的 JSON 对象，**必须确保覆盖整个视频（0-{int(video_duration)}秒）**，**不要包含任何 Markdown 标记**。
 
-**关键点数量规则（重要）：**
-- 视频时长 ≤ 3分钟：每个章节1-2个关键点
-- 视频时长 ≤ 15分钟：每个章节2-3个关键点（11分钟视频应该有4-5个章节，每个章节2-3个关键点，总共8-15个关键点）
-- 视频时长 ≤ 30分钟：每个章节3-4个关键点
-- 视频时长 > 30分钟：每个章节4-5个关键点
+字幕内容（完整视频字幕）：
+{full_text}"""
+    
+    if progress_callback:
+        await progress_callback(50, "正在生成大纲...")
+    
+    # 模型可能比建议多生成一两个章节，输出上限留出余量，避免 JSON 被截断
+    result = await call_llm_for_outline(
+        prompt,
+        subtitles,
+        system_message=_SINGLE_SYSTEM_MESSAGE,
+        max_tokens=_outline_max_tokens(estimated_chapters + 2),
+    )
+    
+    if progress_callback:
+        await progress_callback(90, "正在处理生成结果...")
+    
+    return result
 
-**注意：关键点数量 = 章节数量 × 每个章节的关键点数。例如11分钟视频有4-5个章节，每个2-3个关键点，总共应该有8-15个关键点。**
 
-**输出要求：**
-- **必须返回严格的 JSON 数组格式**，格式如下：
-```json
-[
-    {{
-        "title": "章节标题",
-        "start_time": 0,
-        "description": "章节描述",
-        "key_points": ["关键点1", "关键点2"]
-    }},
-    {{
-        "title": "下一个章节标题",
-        "start_time": 180,
-        "description": "章节描述",
-        "key_points": ["关键点1", "关键点2"]
-    }}
-]
-```
-- **不要包含 Markdown 代码块标记（不要使用 ```json 或 ```）**
-- **不要使用中文字段名（如"开始时间"），必须使用英文字段名（"start_time"）**
-- start_time 必须是数字类型，不是字符串
-- start_time 必须从字幕内容中准确匹配，不能随意猜测
-- **最后一个章节的 start_time 必须在 {int(video_duration * 0.85)}-{int(video_duration * 0.95)}秒之间（不能是最后一秒，应该提前5-15%结束，确保有实际内容）**
-- 标题、描述和关键点都必须基于字幕内容，不能随意编造
+def _prepare_segment(
+    segment: List[Dict[str, Any]],
+    segment_idx: int,
+    segment_count: int
+) -> Optional[Tuple[str, float, float, str]]:
+    """
+    提取单个分段的字幕文本和参数
+    
+    Returns:
+        (字幕文本, 开始时间, 结束时间, 每章节关键点数)；分段为空或文本过短时返回 None
+    """
+    if not segment:
+        return None
+    
+    # 提取该段的文本：超出 token 预算的部分随后一定会被截掉，拼接到预算可容纳的最大字符数（多 1 个用于判断超长）即停止
+    segment_text = SubtitleParser.extract_text_only(
+        segment,
+        max_length=max_chars_for_tokens(SEGMENT_TOKEN_BUDGET) + 1
+    )
+    if len(segment_text) < 50:
+        return None
+    
+    segment_start_time = segment[0].get('start_time', 0)
+    segment_end_time = segment[-1].get('end_time', 0)
+    
+    logger.info(
+        f"[OutlineLLM] 处理第 {segment_idx + 1}/{segment_count} 段 "
+        f"({segment_start_time:.1f}s - {segment_end_time:.1f}s, {len(segment_text)} 字符)"
+    )
+    
+    # 限制单段文本长度（按估算 token 数，中英文字幕的实际输入规模一致）
+    max_segment_tokens = SEGMENT_TOKEN_BUDGET
+    truncated_text = truncate_to_token_budget(segment_text, max_segment_tokens)
+    if len(truncated_text) < len(segment_text):
+        logger.warning(f"[OutlineLLM] 段文本过长，截取前 {len(truncated_text)} 字符（约 {max_segment_tokens} tokens）")
+        segment_text = truncated_text
+    
+    # 计算片段时长（分钟）
+    segment_duration_minutes = (segment_end_time - segment_start_time) / 60
+    
+    # 根据片段时长确定关键点数量
+    if segment_duration_minutes <= 3:
+        key_points_per_chapter = "1-2个"
+    elif segment_duration_minutes <= 10:
+        key_points_per_chapter = "2-3个"
+    else:
+        key_points_per_chapter = "3-4个"
+    
+    return segment_text, segment_start_time, segment_end_time, key_points_per_chapter
 
-字幕内容（完整视频字幕）：
-{full_text}
 
-请返回 JSON 数组格式的大纲列表，**必须确保覆盖整个视频（0-{int(video_duration)}秒）**，**不要包含任何 Markdown 标记**："""
+async def _llm_extract_outline_batched(
+    prepared_segments: List[Optional[Tuple[str, float, float, str]]],
+    subtitles: List[Dict[str, Any]],
+    progress_callback: Optional[Callable[[int, str], None]] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    批量分段模式：所有分段放在一次请求中，任务说明只预填充一次
+    
+    Returns:
+        合并后的大纲列表；超出输出上限或上下文预算、响应不合法或任一段没有章节时返回 None
+        （调用方回退到逐段请求）
+    """
+    prepared = [params for params in prepared_segments if params]
+    if not prepared:
+        return None
+    
+    # 输出上限与其他大纲请求一致，不截断 JSON：段数太多时直接逐段请求
+    max_tokens = len(prepared) * _BATCH_OUTPUT_TOKENS_PER_SEGMENT
+    if max_tokens > _OUTLINE_MAX_TOKENS:
+        logger.info(
+            f"[OutlineLLM] {len(prepared)} 段需要约 {max_tokens} 个输出 tokens，"
+            f"超出单次请求上限 {_OUTLINE_MAX_TOKENS}，使用逐段请求"
+        )
+        return None
+    
+    input_tokens = sum(estimate_tokens(params[0]) for params in prepared)
+    required_tokens = input_tokens + max_tokens + _BATCH_CONTEXT_RESERVED_TOKENS
+    if required_tokens > settings.OUTLINE_LLM_CONTEXT_TOKENS:
+        logger.info(
+            f"[OutlineLLM] 分段总量约 {required_tokens} tokens，"
+            f"超出上下文长度 {settings.OUTLINE_LLM_CONTEXT_TOKENS}，使用逐段请求"
+        )
+        return None
+    # 本地模型（Ollama）超出 num_ctx 时静默截断提示词，可能丢失任务说明或前面的分段却仍返回格式正确的结果：
+    # 放不下时批量请求只发给云端，云端不可用则回退到逐段请求
+    allow_local = required_tokens <= settings.OUTLINE_LOCAL_LLM_CONTEXT_TOKENS
+    
+    blocks = []
+    for segment_no, (segment_text, start_time, end_time, key_points_per_chapter) in enumerate(prepared, 1):
+        blocks.append(
+            f"=== 第 {segment_no} 段：{start_time:.1f}-{end_time:.1f}秒"
+            f"（约 {(end_time - start_time) / 60:.1f} 分钟），关键点：每个章节 {key_points_per_chapter} ===\n"
+            f"{segment_text}"
+        )
+    prompt = (
+        f"共 {len(prepared)} 个片段，请返回 {{\"segments\": [...]}} 格式的 JSON 对象，"
+        f"segments 中恰好 {len(prepared)} 个数组，**不要包含任何 Markdown 标记**。\n\n"
+        + "\n\n".join(blocks)
+    )
     
+    logger.info(f"[OutlineLLM] 批量分段模式：{len(prepared)} 段合并为一次请求（约 {input_tokens} tokens）")
     if progress_callback:
-        await progress_callback(50, "正在生成大纲...")
+        await progress_callback(50, f"正在一次性生成 {len(prepared)} 段的大纲...")
     
-    result = await call_llm_for_outline(prompt, subtitles)
+    segment_outlines = await call_llm_for_outline(
+        prompt,
+        subtitles,
+        system_message=_BATCH_SYSTEM_MESSAGE,
+        max_tokens=max_tokens,
+        parse=lambda text: parse_batched_llm_response(text, len(prepared)),
+        allow_local=allow_local,
+    )
+    # 解析时已保证每段都有章节；部分段为空的结果同样回退，避免大纲缺少整段内容
+    if not segment_outlines or not all(segment_outlines):
+        logger.warning("[OutlineLLM] 批量分段请求未得到有效结果，回退到逐段请求")
+        return None
+    
+    all_outlines = []
+    for (_, start_time, end_time, _), segment_outline in zip(prepared, segment_outlines):
+        # 验证时间范围
+        clamp_to_segment_range(segment_outline, start_time, end_time)
+        all_outlines.extend(segment_outline)
     
     if progress_callback:
         await progress_callback(90, "正在处理生成结果...")
     
-    return result
+    logger.info(f"[OutlineLLM] 批量分段处理完成，共生成 {len(all_outlines)} 个章节")
+    return all_outlines
 
 
 async def llm_extract_outline_segmented(
     full_text: str,
     subtitles: List[Dict[str, Any]],
     progress_callback: Optional[Callable[[int, str], None]] = None
-) -> List[Dict[str, Any]]:
-    """分段处理模式（适用于长视频）"""
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    分段处理模式（适用于长视频）
+    
+    Returns:
+        (大纲列表, 是否完整)：每个有效分段（字幕文本足够长）都得到章节时才算完整
+    """
     # 将字幕按时间分段（每段约10分钟）
     segments = split_subtitles_by_time(subtitles, segment_duration=600)
     logger.info(f"[OutlineLLM] 视频分为 {len(segments)} 段进行处理")
     
     if progress_callback:
-        await progress_callback(25, f"视频分为 {len(segments)} 段，开始逐段处理...")
+        await progress_callback(25, f"视频分为 {len(segments)} 段，开始分段处理...")
     
-    all_outlines = []
+    # 每段的字幕文本和参数只提取一次，批量请求和逐段请求（回退时）共用
+    prepared_segments = [
+        _prepare_segment(segment, segment_idx, len(segments))
+        for segment_idx, segment in enumerate(segments)
+    ]
     
-    # 逐段处理
-    for segment_idx, segment in enumerate(segments):
-        if not segment:
-            continue
+    # 优先把所有分段合并为一次请求（任务说明只预填充一次），超出上下文预算或失败时逐段请求
+    if settings.OUTLINE_BATCH_SEGMENTS and len(segments) > 1:
+        batched_outlines = await _llm_extract_outline_batched(prepared_segments, subtitles, progress_callback)
+        if batched_outlines is not None:
+            # 批量结果只有在每段都有章节时才会返回
+            return batched_outlines, True
+    
+    # 分段并发处理：段之间互不依赖，同时最多 OUTLINE_SEGMENT_CONCURRENCY 段在请求中
+    # （本地 Ollama 需要 OLLAMA_NUM_PARALLEL >= 该值才能真正并行推理，否则在服务端排队）
+    segment_semaphore = asyncio.Semaphore(max(1, settings.OUTLINE_SEGMENT_CONCURRENCY))
+    completed_segments = 0
+    
+    async def _process_segment(
+        segment_idx: int,
+        segment: List[Dict[str, Any]],
+        params: Optional[Tuple[str, float, float, str]]
+    ) -> Optional[List[Dict[str, Any]]]:
+        nonlocal completed_segments
+        if params is None:
+            return None
+        segment_text, segment_start_time, segment_end_time, key_points_per_chapter = params
+        segment_duration_minutes = (segment_end_time - segment_start_time) / 60
         
-        # 提取该段的文本
-        segment_text = SubtitleParser.extract_text_only(segment)
-        if len(segment_text) < 50:
-            continue
+        # 用户消息：参数在前、字幕在最后（任务说明在系统消息中，各段共享）
+        prompt = f"""参数：
+- 段号：第 {segment_idx + 1} 段（共 {len(segments)} 段）
+- 片段时间范围：{segment_start_time:.1f}秒 - {segment_end_time:.1f}秒（约 {segment_duration_minutes:.1f} 分钟）
+- 关键点：每个章节 {key_points_per_chapter}
+
+请返回 {{"outline": [...]}} 格式的 JSON 对象，start_time 不能超出 {segment_start_time:.1f}-{segment_end_time:.1f}秒，**不要包含任何 Markdown 标记**。
+
+字幕片段内容：
+{segment_text}"""
         
-        segment_start_time = segment[0].get('start_time', 0)
-        segment_end_time = segment[-1].get('end_time', 0)
+        async with segment_semaphore:
+            segment_outline = await call_llm_for_outline(
+                prompt,
+                segment,
+                system_message=_SEGMENT_SYSTEM_MESSAGE,
+                max_tokens=_outline_max_tokens(_SEGMENT_MAX_CHAPTERS),
+            )
         
-        logger.info(
-            f"[OutlineLLM] 处理第 {segment_idx + 1}/{len(segments)} 段 "
-            f"({segment_start_time:.1f}s - {segment_end_time:.1f}s, {len(segment_text)} 字符)"
-        )
+        # 验证时间范围
+        clamp_to_segment_range(segment_outline, segment_start_time, segment_end_time)
         
+        completed_segments += 1
         if progress_callback:
-            progress = 25 + int((segment_idx + 1) / len(segments) * 65)  # 25% - 90%
+            progress = 25 + int(completed_segments / len(segments) * 65)  # 25% - 90%
             await progress_callback(
                 progress, 
-                f"正在处理第 {segment_idx + 1}/{len(segments)} 段..."
+                f"已完成 {completed_segments}/{len(segments)} 段..."
             )
         
-        # 限制单段文本长度
-        max_segment_length = 6000
-        if len(segment_text) > max_segment_length:
-            logger.warning(f"[OutlineLLM] 段文本过长，截取前 {max_segment_length} 字符")
-            segment_text = segment_text[:max_segment_length]
-        
-        # 计算片段时长（分钟）
-        segment_duration_minutes = (segment_end_time - segment_start_time) / 60
-        
-        # 根据片段时长确定关键点数量
-        if segment_duration_minutes <= 3:
-            key_points_per_chapter = "1-2个"
-        elif segment_duration_minutes <= 10:
-            key_points_per_chapter = "2-3个"
-        else:
-            key_points_per_chapter = "3-4个"
-        
-        prompt = f"""请分析以下视频字幕片段，提取该片段的章节/主题大纲。
+        return segment_outline
+    
+    # gather 按传入顺序返回结果，与各段完成先后无关
+    segment_results = await asyncio.gather(
+        *(
+            _process_segment(segment_idx, segment, params)
+            for segment_idx, (segment, params) in enumerate(zip(segments, prepared_segments))
+        )
+    )
+    
+    all_outlines = [item for result in segment_results if result for item in result]
+    missing_segments = sum(
+        1 for params, result in zip(prepared_segments, segment_results)
+        if params is not None and not result
+    )
+    if missing_segments:
+        logger.warning(f"[OutlineLLM] {missing_segments} 段没有生成章节，大纲不完整")
+    logger.info(f"[OutlineLLM] 分段处理完成，共生成 {len(all_outlines)} 个章节")
+    
+    return all_outlines, bool(all_outlines) and not missing_segments
 
-这是视频的第 {segment_idx + 1} 段（共 {len(segments)} 段），时间范围：{segment_start_time:.1f}秒 - {segment_end_time:.1f}秒（约 {segment_duration_minutes:.1f} 分钟）。
 
-**关键要求：**
-1. 识别该片段的主要主题和章节（2-5 个章节，根据片段长度调整）
-2. **标题要求**：章节标题必须基于字幕内容生成，不能使用"开始"、"中间章节"、"最后章节"等通用名称。标题应该概括该章节的核心主题，10字以内，简洁明了
-3. **描述要求**：章节简要描述必须基于字幕内容，准确概括该章节的主要内容，不能随意编造
-4. **关键点要求**：关键知识点/内容点必须基于字幕内容，每个章节 {key_points_per_chapter} 关键点，每个10-20字，不能随意编造
+def _response_cache_key(
+    model: str,
+    system_message: Dict[str, str],
+    prompt: str,
+    max_tokens: int = _OUTLINE_MAX_TOKENS
+) -> Optional[str]:
+    """计算 LLM 响应缓存键（未启用缓存时返回 None）"""
+    if not settings.OUTLINE_LLM_CACHE_ENABLED:
+        return None
+    return build_response_cache_key(
+        model, _OUTLINE_TEMPERATURE, max_tokens, system_message["content"], prompt
+    )
 
-**每个章节格式：**
-- title: 章节标题（基于字幕内容，10字以内，不能使用通用名称）
-- start_time: 开始时间（秒，必须在该片段的时间范围内：{segment_start_time:.1f}-{segment_end_time:.1f}秒，从字幕中准确匹配）
-- description: 章节简要描述（20-50字，基于字幕内容）
-- key_points: 关键知识点/内容点列表（{key_points_per_chapter} 要点，每个10-20字，基于字幕内容）
 
-**输出要求：**
-- **必须返回严格的 JSON 数组格式**，格式如下：
-```json
-[
-    {{
-        "title": "章节标题",
-        "start_time": {segment_start_time:.0f},
-        "description": "章节描述",
-        "key_points": ["关键点1", "关键点2"]
-    }}
-]
-```
-- **不要包含 Markdown 代码块标记（不要使用 ```json 或 ```）**
-- **不要使用中文字段名（如"开始时间"），必须使用英文字段名（"start_time"）**
-- start_time 必须是数字类型，不是字符串
-- start_time 必须准确，不能超出片段时间范围（{segment_start_time:.1f}-{segment_end_time:.1f}秒）
-- 标题、描述和关键点都必须基于字幕内容，不能随意编造
+async def _load_cached_outline(
+    cache_key: Optional[str],
+    parse: Callable[[str], List[Any]] = parse_llm_response
+) -> List[Any]:
+    """读取并解析缓存的 LLM 响应，未命中时返回空列表"""
+    if not cache_key:
+        return []
+    response_text = await asyncio.to_thread(load_cached_response, cache_key)
+    if not response_text:
+        return []
+    outline = await asyncio.to_thread(parse, response_text)
+    if outline:
+        logger.info("[OutlineLLM] 命中 LLM 响应缓存，跳过模型调用")
+    return outline
 
-字幕片段内容：
-{segment_text}
 
-请返回 JSON 数组格式的大纲列表，**不要包含任何 Markdown 标记**："""
-        
-        segment_outline = await call_llm_for_outline(prompt, segment)
-        
-        # 验证时间范围
-        for item in segment_outline:
-            start_time = item.get('start_time', 0)
-            if start_time < segment_start_time or start_time > segment_end_time:
-                # 时间超出范围，调整到片段开始时间
-                logger.warning(
-                    f"[OutlineLLM] 章节时间 {start_time:.1f}s 超出片段范围 "
-                    f"({segment_start_time:.1f}s - {segment_end_time:.1f}s)，调整为片段开始时间"
-                )
-                item['start_time'] = segment_start_time
-        
-        all_outlines.extend(segment_outline)
-        
-        # 段之间稍作延迟，避免 GPU 负载过高
-        if segment_idx < len(segments) - 1:
-            await asyncio.sleep(1.0)
+class _RetryableStatusError(Exception):
+    """LLM 接口返回可重试的 HTTP 状态码"""
     
-    logger.info(f"[OutlineLLM] 分段处理完成，共生成 {len(all_outlines)} 个章节")
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class _JsonCompletionScanner:
+    """
+    流式响应的 JSON 完整性检测：逐块扫描，顶层 JSON 对象/数组闭合即返回 True
     
-    return all_outlines
+    与 parse_llm_response 方法2的括号匹配规则相同：忽略字符串内的括号，处理转义字符
+    
+    第一个括号之前只能是空白或代码块开头标记，否则（如“以下是[大纲]：{...}”）括号可能属于说明文字，
+    不再检测，读完整个流
+    """
+    
+    def __init__(self):
+        self._depth = 0
+        self._started = False
+        self._disabled = False
+        self._preamble: List[str] = []  # 第一个括号之前的内容
+        self._in_string = False
+        self._escape_next = False
+    
+    def feed(self, chunk: str) -> bool:
+        if self._disabled:
+            return False
+        for char in chunk:
+            if self._in_string:
+                if self._escape_next:
+                    self._escape_next = False
+                elif char == '\\':
+                    self._escape_next = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '{' or char == '[':
+                if not self._started:
+                    if not _JSON_PREAMBLE_RE.fullmatch(''.join(self._preamble)):
+                        self._disabled = True
+                        return False
+                    self._started = True
+                self._depth += 1
+            elif not self._started:
+                # 顶层 JSON 开始之前的内容（如 ```json）不参与匹配
+                self._preamble.append(char)
+            elif char == '"':
+                self._in_string = True
+            elif char == '}' or char == ']':
+                self._depth -= 1
+                if self._depth == 0:
+                    return True
+        return False
+
+
+async def _read_streamed_content(response: httpx.Response) -> str:
+    """
+    读取 OpenAI 兼容的 SSE 流，拼接 delta.content
+    
+    顶层 JSON 闭合后立即停止读取：退出 client.stream 上下文时连接被关闭，服务端随之停止生成，
+    省去模型在 JSON 之后继续输出的 token
+    """
+    scanner = _JsonCompletionScanner()
+    parts: List[str] = []
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = fast_json_loads(data)
+        except ValueError:
+            continue
+        choices = chunk.get("choices") or [{}]
+        content = (choices[0].get("delta") or {}).get("content")
+        if not content:
+            continue
+        parts.append(content)
+        if scanner.feed(content):
+            logger.info("[OutlineLLM] 响应 JSON 已完整，提前结束流式读取")
+            break
+    return "".join(parts)
+
+
+def _handle_error_status(response: httpx.Response, label: str) -> None:
+    """记录非 200 响应；状态码可重试时抛出 _RetryableStatusError"""
+    logger.error(f"{label}调用失败: {response.status_code} - {response.text}")
+    if response.status_code in _RETRYABLE_STATUS_CODES:
+        raise _RetryableStatusError(response.status_code)
+    return None
+
+
+async def _request_with_retry(
+    send: Callable[[], Awaitable[Optional[str]]],
+    label: str
+) -> Optional[str]:
+    """
+    执行请求，遇到可重试状态码时指数退避（带随机抖动）后重试
+    
+    send 内部负责获取/释放并发名额，退避等待期间不占用信号量；多次失败后返回 None
+    """
+    for attempt in range(_MAX_REQUEST_ATTEMPTS):
+        try:
+            return await send()
+        except _RetryableStatusError as e:
+            if attempt == _MAX_REQUEST_ATTEMPTS - 1:
+                logger.error(f"[OutlineLLM] {label}连续 {_MAX_REQUEST_ATTEMPTS} 次返回可重试错误，放弃")
+                return None
+            delay = 0.5 * (2 ** attempt) + random.random() * 0.2
+            logger.warning(
+                f"[OutlineLLM] {label}返回 {e.status_code}，{delay:.2f} 秒后重试"
+                f"（第 {attempt + 2}/{_MAX_REQUEST_ATTEMPTS} 次）"
+            )
+            await asyncio.sleep(delay)
+    return None
+
+
+async def _request_chat_completion(
+    client: httpx.AsyncClient,
+    url: str,
+    payload: Dict[str, Any],
+    timeout: Any,
+    label: str,
+    headers: Optional[Dict[str, str]] = None
+) -> Optional[str]:
+    """
+    调用 chat/completions 接口，返回模型输出文本
+    
+    HTTP 状态码可重试（见 _RETRYABLE_STATUS_CODES）时抛出 _RetryableStatusError，其他非 200 状态码返回 None；
+    
+    OUTLINE_LLM_STREAM 开启时使用流式响应，并在 JSON 闭合后提前结束；
+    请求体和响应体都用 fast_json_dumps / fast_json_loads 处理（orjson 可用时绕过标准库 json）
+    """
+    headers = headers or _JSON_HEADERS
+    if not settings.OUTLINE_LLM_STREAM:
+        response = await client.post(
+            url, content=fast_json_dumps({**payload, "stream": False}), headers=headers, timeout=timeout
+        )
+        if response.status_code != 200:
+            return _handle_error_status(response, label)
+        response_data = fast_json_loads(response.content)
+        return response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    
+    async with client.stream(
+        "POST", url, content=fast_json_dumps({**payload, "stream": True}), headers=headers, timeout=timeout
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return _handle_error_status(response, label)
+        return await _read_streamed_content(response)
 
 
 async def _call_cloud_llm_for_outline(
     prompt: str,
-    subtitles: List[Dict[str, Any]]
-) -> List[Dict[str, Any]]:
+    subtitles: List[Dict[str, Any]],
+    system_message: Dict[str, str] = _SYSTEM_MESSAGE,
+    max_tokens: int = _OUTLINE_MAX_TOKENS,
+    parse: Callable[[str], List[Any]] = parse_llm_response
+) -> List[Any]:
     """调用云端 LLM 提取大纲"""
     timeout = 60.0
     api_key = settings.LLM_API_KEY
@@ -347,14 +901,13 @@ async def _call_cloud_llm_for_outline(
         logger.warning("[OutlineLLM] 云端 API key 未配置，跳过云端调用")
         return []
 
+    cache_key = _response_cache_key(model, system_message, prompt, max_tokens)
+    cached_outline = await _load_cached_outline(cache_key, parse)
+    if cached_outline:
+        return cached_outline
+
     try:
-        messages = [
-            {
-                "role": "system", 
-                "content": "你是一个专业的视频内容分析助手，擅长从字幕中提取视频章节大纲。\n\n**重要：你必须只返回纯 JSON 数组格式，不要包含任何 Markdown 代码块标记（不要使用 ```json 或 ```）。\n\nJSON 格式示例：\n[\n  {\n    \"title\": \"章节标题\",\n    \"start_time\": 0,\n    \"description\": \"章节描述\",\n    \"key_points\": [\"关键点1\", \"关键点2\"]\n  }\n]\n\n注意：\n- 必须使用英文字段名（title, start_time, description, key_points）\n- start_time 必须是数字，不是字符串\n- 不要使用中文字段名（如\"开始时间\"）\n- 不要包含 Markdown 标记"
-            },
-            {"role": "user", "content": prompt}
-        ]
+        messages = [system_message, {"role": "user", "content": prompt}]
         
         headers = {
             "Authorization": f"Bearer {api_key}",
@@ -364,36 +917,45 @@ async def _call_cloud_llm_for_outline(
         payload = {
             "model": model,
             "messages": messages,
-            "temperature": 0.3,
-            "max_tokens": 3000,
+            "temperature": _OUTLINE_TEMPERATURE,
+            "max_tokens": max_tokens,
         }
+        if settings.OUTLINE_JSON_MODE:
+            payload["response_format"] = _JSON_RESPONSE_FORMAT
 
         logger.info(f"[OutlineLLM] 正在调用云端模型: {model} @ {base_url} (超时: {timeout}s)")
 
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.post(
+        # 共享 HTTP/2 客户端：并发分段请求复用同一连接
+        client = get_cloud_http_client()
+        response_text = await _request_with_retry(
+            lambda: _request_chat_completion(
+                client,
                 f"{base_url}/chat/completions",
-                json=payload,
+                payload,
+                httpx.Timeout(timeout, connect=5.0, write=10.0),  # 网络不通时快速失败
+                "云端模型",
                 headers=headers,
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"云端模型调用失败: {response.status_code} - {response.text}")
-                return []
-            
-            response_data = response.json()
-            response_text = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
-            
-            if not response_text:
-                logger.warning("云端模型返回空响应")
-                return []
-            
-            logger.info(f"[OutlineLLM] 云端模型调用成功，响应长度: {len(response_text)} 字符")
-            
-            # 解析响应
-            outline = parse_llm_response(response_text)
-            
-            return outline
+            ),
+            "云端模型",
+        )
+        
+        if response_text is None:
+            return []
+        
+        if not response_text:
+            logger.warning("云端模型返回空响应")
+            return []
+        
+        logger.info(f"[OutlineLLM] 云端模型调用成功，响应长度: {len(response_text)} 字符")
+        
+        # 解析响应（放到线程中执行，避免多级正则回退阻塞事件循环）
+        outline = await asyncio.to_thread(parse, response_text)
+        
+        # 只缓存能解析出大纲的响应
+        if outline and cache_key:
+            await asyncio.to_thread(save_cached_response, cache_key, response_text)
+        
+        return outline
             
     except httpx.TimeoutException:
         logger.error(f"云端模型调用超时 ({timeout}s)")
@@ -405,16 +967,37 @@ async def _call_cloud_llm_for_outline(
 
 async def call_llm_for_outline(
     prompt: str,
-    subtitles: List[Dict[str, Any]]
-) -> List[Dict[str, Any]]:
-    """调用 LLM 提取大纲（通用方法）"""
+    subtitles: List[Dict[str, Any]],
+    system_message: Dict[str, str] = _SYSTEM_MESSAGE,
+    max_tokens: int = _OUTLINE_MAX_TOKENS,
+    parse: Callable[[str], List[Any]] = parse_llm_response,
+    allow_local: bool = True
+) -> List[Any]:
+    """
+    调用 LLM 提取大纲（通用方法）
+    
+    Args:
+        prompt: 用户消息（参数 + 字幕文本）
+        subtitles: 字幕条目列表
+        system_message: 系统消息（模块级常量，保持逐字节稳定以便复用前缀缓存）
+        max_tokens: 最大输出 token 数
+        parse: 响应解析函数（批量分段模式按段解析），解析失败时应返回空列表
+        allow_local: 是否允许使用本地模型（请求超出本地模型上下文长度时为 False）
+    """
     llm_mode = getattr(settings, "LLM_MODE", "hybrid").lower()
     use_cloud = llm_mode in ("cloud_only", "hybrid") and bool(settings.LLM_API_KEY)
     use_local = llm_mode in ("local_only", "hybrid")
+    if use_local and not allow_local:
+        logger.info("[OutlineLLM] 请求超出本地模型上下文长度，不使用本地模型")
+        use_local = False
+        if not use_cloud:
+            return []
 
     # 云端优先（如启用）
     if use_cloud:
-        cloud_result = await _call_cloud_llm_for_outline(prompt, subtitles)
+        cloud_result = await _call_cloud_llm_for_outline(
+            prompt, subtitles, system_message, max_tokens, parse
+        )
         if cloud_result:
             return cloud_result
         logger.warning("[OutlineLLM] 云端模型不可用，尝试回退到本地模型（如已启用）")
@@ -424,65 +1007,68 @@ async def call_llm_for_outline(
         logger.info("[OutlineLLM] LLM_MODE=off，跳过大纲生成")
         return []
     
+    # 命中缓存时不占用信号量、不触发请求冷却
+    cache_key = _response_cache_key(settings.LOCAL_LLM_MODEL, system_message, prompt, max_tokens)
+    cached_outline = await _load_cached_outline(cache_key, parse)
+    if cached_outline:
+        return cached_outline
+    
+    # 调用本地模型服务（Ollama API）
+    base_url = settings.LOCAL_LLM_BASE_URL.rstrip("/")
+    model = settings.LOCAL_LLM_MODEL
+    # 增加超时时间，长视频需要更长时间
+    timeout = max(settings.LOCAL_LLM_TIMEOUT, 120.0)  # 至少120秒
+    
     try:
-        # 使用信号量控制并发，避免 GPU 负载波动（仅在本地模型模式下）
-        async with _llm_semaphore:
+        messages = [system_message, {"role": "user", "content": prompt}]
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": _OUTLINE_TEMPERATURE,
+            "max_tokens": max_tokens,  # 增加输出长度限制
+        }
+        if settings.OUTLINE_JSON_MODE:
+            payload["response_format"] = _JSON_RESPONSE_FORMAT
+        
+        # 共享本地客户端：分段请求复用 keep-alive 连接
+        client = get_local_http_client()
+        
+        async def _send() -> Optional[str]:
             # 请求冷却：避免频繁调用 GPU，减少电流滋滋声（仅在本地模型模式下）
-            global _last_request_time
-            if _last_request_time is not None:
-                time_since_last = asyncio.get_event_loop().time() - _last_request_time
-                if time_since_last < _request_cooldown:
-                    wait_time = _request_cooldown - time_since_last
-                    logger.info(f"[OutlineLLM] 请求冷却中，等待 {wait_time:.2f} 秒...")
-                    await asyncio.sleep(wait_time)
-            
-            _last_request_time = asyncio.get_event_loop().time()
-            
-            # 调用本地模型服务（Ollama API）
-            base_url = settings.LOCAL_LLM_BASE_URL.rstrip("/")
-            model = settings.LOCAL_LLM_MODEL
-            # 增加超时时间，长视频需要更长时间
-            timeout = max(settings.LOCAL_LLM_TIMEOUT, 120.0)  # 至少120秒
-            
-            messages = [
-                {
-                    "role": "system", 
-                    "content": "你是一个专业的视频内容分析助手，擅长从字幕中提取视频章节大纲。\n\n**重要：你必须只返回纯 JSON 数组格式，不要包含任何 Markdown 代码块标记（不要使用 ```json 或 ```）。\n\nJSON 格式示例：\n[\n  {\n    \"title\": \"章节标题\",\n    \"start_time\": 0,\n    \"description\": \"章节描述\",\n    \"key_points\": [\"关键点1\", \"关键点2\"]\n  }\n]\n\n注意：\n- 必须使用英文字段名（title, start_time, description, key_points）\n- start_time 必须是数字，不是字符串\n- 不要使用中文字段名（如\"开始时间\"）\n- 不要包含 Markdown 标记"
-                },
-                {"role": "user", "content": prompt}
-            ]
-            
-            logger.info(f"[OutlineLLM] 正在调用本地模型: {model} @ {base_url} (超时: {timeout}s)")
+            # 在获取信号量之前等待，冷却期间不占用并发名额
+            await _request_rate_limiter.acquire()
             
-            async with httpx.AsyncClient(timeout=timeout, trust_env=False) as client:
-                response = await client.post(
+            # 使用信号量控制并发，避免 GPU 负载波动（仅在本地模型模式下）
+            # 只包住 HTTP 请求本身：重试退避和响应解析都不占用并发名额
+            async with _llm_semaphore:
+                logger.info(f"[OutlineLLM] 正在调用本地模型: {model} @ {base_url} (超时: {timeout}s)")
+                return await _request_chat_completion(
+                    client,
                     f"{base_url}/chat/completions",
-                    json={
-                        "model": model,
-                        "messages": messages,
-                        "temperature": 0.3,
-                        "max_tokens": 3000,  # 增加输出长度限制
-                        "stream": False
-                    }
+                    payload,
+                    httpx.Timeout(timeout, connect=5.0, write=10.0),  # 本地服务未启动时快速失败
+                    "本地模型",
                 )
-                
-                if response.status_code != 200:
-                    logger.error(f"本地模型调用失败: {response.status_code} - {response.text}")
-                    return []
-                
-                response_data = response.json()
-                response_text = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
-                
-                if not response_text:
-                    logger.warning("本地模型返回空响应")
-                    return []
-                
-                logger.info(f"[OutlineLLM] 本地模型调用成功，响应长度: {len(response_text)} 字符")
-                
-                # 解析响应
-                outline = parse_llm_response(response_text)
-                
-                return outline
+        
+        response_text = await _request_with_retry(_send, "本地模型")
+        
+        if response_text is None:
+            return []
+        
+        if not response_text:
+            logger.warning("本地模型返回空响应")
+            return []
+        
+        logger.info(f"[OutlineLLM] 本地模型调用成功，响应长度: {len(response_text)} 字符")
+        
+        # 解析响应（放到线程中执行，避免多级正则回退阻塞事件循环）
+        outline = await asyncio.to_thread(parse, response_text)
+        
+        # 只缓存能解析出大纲的响应
+        if outline and cache_key:
+            await asyncio.to_thread(save_cached_response, cache_key, response_text)
+        
+        return outline
             
     except httpx.TimeoutException:
         logger.error(f"本地模型调用超时 ({timeout}s)")
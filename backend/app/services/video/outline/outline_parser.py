@@ -6,37 +6,96 @@
 import json
 import logging
 import re
+from operator import itemgetter
 from typing import List, Dict, Any
 
 from app.core.types import OutlineEntry
+from app.utils.json_utils import fast_json_loads
 
 logger = logging.getLogger(__name__)
 
+# 代码块标记：一次匹配同时去掉开头的 ```json / ``` 和结尾的 ```
+_FENCE_RE = re.compile(r'^```(?:json)?\s*\n?(.*?)\n?```\s*$', re.DOTALL | re.IGNORECASE)
+_FENCE_OPEN_RE = re.compile(r'^```(?:json)?\s*\n?', re.IGNORECASE)
+
+# 解析回退链使用的正则（模块加载时编译一次）
+_TRAILING_COMMA_ARRAY_RE = re.compile(r',\s*\]')
+_TRAILING_COMMA_OBJECT_RE = re.compile(r',\s*\}')
+_TRAILING_COMMA_END_RE = re.compile(r',\s*$')
+_ARRAY_FIRST_OBJECT_RE = re.compile(r'\[\s*(\{.*?\})\s*\]', re.DOTALL)
+_ARRAY_ALL_OBJECTS_RE = re.compile(r'\[\s*(\{.*\})\s*\]', re.DOTALL)
+_OBJECT_WITH_TITLE_RE = re.compile(r'\{[^{}]*"title"[^{}]*\}', re.DOTALL)
+_TITLE_FIELD_RE = re.compile(r'"title"\s*:\s*"([^"]*)"')
+_START_TIME_FIELD_RE = re.compile(r'"start_time"\s*:\s*(\d+(?:\.\d+)?)')
+_CHAPTER_RE = re.compile(r'\{\s*"title"\s*:\s*"([^"]*)"[^}]*"start_time"\s*:\s*(\d+(?:\.\d+)?)', re.DOTALL)
+_DESCRIPTION_FIELD_RE = re.compile(r'"description"\s*:\s*"([^"]*)"')
+_KEY_POINTS_FIELD_RE = re.compile(r'"key_points"\s*:\s*\[(.*?)\]', re.DOTALL)
+_QUOTED_STRING_RE = re.compile(r'"([^"]*)"')
+# 控制字符删除表（保留 \n \r \t），str.translate 在 C 层完成过滤
+_CONTROL_CHARS_TABLE = dict.fromkeys(c for c in range(32) if chr(c) not in '\n\r\t')
+# 数字键字典按整数键排序
+_INDEX_KEY = itemgetter(0)
+# raw_decode 从指定位置解析一个完整的 JSON 值并返回结束位置（字符串/转义由 C 扫描器处理）
+_JSON_DECODER = json.JSONDecoder()
+# 模式2：字段名可能是中文（如 "开始时间": "0" 而不是 "start_time": 0）
+_LOOSE_TITLE_RES = [
+    re.compile(r'"title"\s*:\s*"([^"]*)"'),
+    re.compile(r'"标题"\s*:\s*"([^"]*)"'),
+    re.compile(r'"章节"\s*:\s*"([^"]*)"'),
+]
+_LOOSE_TIME_RES = [
+    re.compile(r'"start_time"\s*:\s*"?(\d+(?:\.\d+)?)"?'),
+    re.compile(r'"开始时间"\s*:\s*"?(\d+(?:\.\d+)?)"?'),
+    re.compile(r'"时间"\s*:\s*"?(\d+(?:\.\d+)?)"?'),
+]
+
+
+def _strip_code_fence(response_text: str) -> str:
+    """去掉首尾空白和代码块标记（处理 ```json ... ``` 格式）"""
+    text = response_text.strip()
+    if text.startswith('```'):
+        fence_match = _FENCE_RE.match(text)
+        if fence_match:
+            text = fence_match.group(1)
+        else:
+            # 响应被截断、没有结尾的 ```：只移除开头的 ```json 或 ```
+            text = _FENCE_OPEN_RE.sub('', text, count=1)
+        text = text.strip()
+    return text
+
 
 def parse_llm_response(response_text: str) -> List[OutlineEntry]:
     """解析 LLM 响应（鲁棒解析，处理格式不完整的 JSON）"""
     try:
-        # 清理响应文本
-        text = response_text.strip()
+        # 快速路径：JSON 模式（response_format=json_object）下响应本身就是合法 JSON，一次解析即可
+        try:
+            return extract_outline_list(fast_json_loads(response_text))
+        except json.JSONDecodeError:
+            pass
         
-        # 移除代码块标记（处理 ```json ... ``` 格式）
-        if text.startswith('```'):
-            # 移除开头的 ```json 或 ```
-            text = re.sub(r'^```(?:json)?\s*\n?', '', text, flags=re.IGNORECASE)
-            # 移除结尾的 ```
-            text = re.sub(r'\n?```\s*$', '', text)
-            text = text.strip()
+        # 清理响应文本，移除代码块标记
+        text = _strip_code_fence(response_text)
         
         # 方法1：尝试直接解析
         try:
-            data = json.loads(text)
+            data = fast_json_loads(text)
             return extract_outline_list(data)
         except json.JSONDecodeError:
             pass
         
+        # 以下为回退解析：模型输出了不完整或不合法的 JSON（JSON 模式下不应出现）
+        logger.warning(f"LLM 响应不是合法 JSON，使用回退解析（响应长度: {len(text)} 字符）")
+        
         # 方法2：提取 JSON 数组部分（改进版）
         json_start = text.find('[')
         if json_start >= 0:
+            # 数组本身合法（只是前后夹杂说明文字）时，raw_decode 一次解析即可
+            try:
+                data, _ = _JSON_DECODER.raw_decode(text, json_start)
+                return extract_outline_list(data)
+            except json.JSONDecodeError:
+                pass
+            
             # 从 [ 开始，尝试找到匹配的 ]
             bracket_count = 0
             in_string = False
@@ -69,63 +128,56 @@ def parse_llm_response(response_text: str) -> List[OutlineEntry]:
             
             json_text = text[json_start:json_end]
             
-            # 尝试修复常见的 JSON 问题
-            # 1. 移除尾部的逗号
-            json_text = re.sub(r',\s*\]', ']', json_text)
-            json_text = re.sub(r',\s*\}', '}', json_text)
-            
-            # 2. 修复未闭合的字符串
-            if json_text and json_text[-1] != ']':
-                last_brace = json_text.rfind('}')
-                if last_brace > 0:
-                    json_text = json_text[:last_brace + 1] + ']'
+            # 尝试修复常见的 JSON 问题：移除尾部的逗号
+            # （未找到匹配的 ] 时不做启发式补全，直接交给方法3处理）
+            json_text = _TRAILING_COMMA_ARRAY_RE.sub(']', json_text)
+            json_text = _TRAILING_COMMA_OBJECT_RE.sub('}', json_text)
             
             try:
-                data = json.loads(json_text)
+                data = fast_json_loads(json_text)
                 return extract_outline_list(data)
             except json.JSONDecodeError as e:
                 logger.warning(f"方法2解析失败: {e}")
         
         # 方法3：使用正则表达式提取 JSON 数组（更宽松，支持多行）
-        json_match = re.search(r'\[\s*(\{.*?\})\s*\]', text, re.DOTALL)
+        json_match = _ARRAY_FIRST_OBJECT_RE.search(text)
         if not json_match:
             # 尝试匹配多个对象
-            json_match = re.search(r'\[\s*(\{.*\})\s*\]', text, re.DOTALL)
+            json_match = _ARRAY_ALL_OBJECTS_RE.search(text)
         
         if json_match:
             json_str = json_match.group(0)
             # 尝试修复
-            json_str = re.sub(r',\s*\]', ']', json_str)
-            json_str = re.sub(r',\s*\}', '}', json_str)
+            json_str = _TRAILING_COMMA_ARRAY_RE.sub(']', json_str)
+            json_str = _TRAILING_COMMA_OBJECT_RE.sub('}', json_str)
             
             try:
-                data = json.loads(json_str)
+                data = fast_json_loads(json_str)
                 return extract_outline_list(data)
             except json.JSONDecodeError:
                 pass
         
         # 方法4：尝试提取所有 JSON 对象，然后组合成数组
-        object_pattern = r'\{[^{}]*"title"[^{}]*\}'
-        matches = re.findall(object_pattern, text, re.DOTALL)
+        matches = _OBJECT_WITH_TITLE_RE.findall(text)
         
         objects = []
         for match in matches:
             try:
                 # 尝试修复常见的JSON问题
-                match_clean = re.sub(r',\s*\}', '}', match)
-                match_clean = re.sub(r',\s*$', '', match_clean)
+                match_clean = _TRAILING_COMMA_OBJECT_RE.sub('}', match)
+                match_clean = _TRAILING_COMMA_END_RE.sub('', match_clean)
                 # 移除控制字符
-                match_clean = ''.join(char for char in match_clean if ord(char) >= 32 or char in '\n\r\t')
+                match_clean = match_clean.translate(_CONTROL_CHARS_TABLE)
                 
-                obj = json.loads(match_clean)
+                obj = fast_json_loads(match_clean)
                 if isinstance(obj, dict) and 'title' in obj:
                     objects.append(obj)
             except:
                 # 如果解析失败，尝试更宽松的匹配
                 try:
                     # 尝试提取 title 和 start_time 字段
-                    title_match = re.search(r'"title"\s*:\s*"([^"]*)"', match)
-                    time_match = re.search(r'"start_time"\s*:\s*(\d+(?:\.\d+)?)', match)
+                    title_match = _TITLE_FIELD_RE.search(match)
+                    time_match = _START_TIME_FIELD_RE.search(match)
                     if title_match and time_match:
                         obj = {
                             'title': title_match.group(1),
@@ -145,8 +197,7 @@ def parse_llm_response(response_text: str) -> List[OutlineEntry]:
         objects = []
         
         # 模式1：标准的对象格式 { "title": "...", "start_time": ... }
-        chapter_pattern1 = r'\{\s*"title"\s*:\s*"([^"]*)"[^}]*"start_time"\s*:\s*(\d+(?:\.\d+)?)'
-        matches1 = re.finditer(chapter_pattern1, text, re.DOTALL)
+        matches1 = _CHAPTER_RE.finditer(text)
         
         for match in matches1:
             try:
@@ -154,15 +205,15 @@ def parse_llm_response(response_text: str) -> List[OutlineEntry]:
                 start_time = float(match.group(2))
                 
                 # 尝试提取 description
-                desc_match = re.search(r'"description"\s*:\s*"([^"]*)"', match.group(0))
+                desc_match = _DESCRIPTION_FIELD_RE.search(match.group(0))
                 description = desc_match.group(1) if desc_match else ''
                 
                 # 尝试提取 key_points
                 key_points = []
-                key_points_match = re.search(r'"key_points"\s*:\s*\[(.*?)\]', match.group(0), re.DOTALL)
+                key_points_match = _KEY_POINTS_FIELD_RE.search(match.group(0))
                 if key_points_match:
                     points_text = key_points_match.group(1)
-                    point_matches = re.findall(r'"([^"]*)"', points_text)
+                    point_matches = _QUOTED_STRING_RE.findall(points_text)
                     key_points = point_matches
                 
                 obj = {
@@ -178,22 +229,9 @@ def parse_llm_response(response_text: str) -> List[OutlineEntry]:
         
         # 模式2：处理格式错误的响应（如 "开始时间": "0" 而不是 "start_time": 0）
         if not objects:
-            # 尝试提取 title 字段（可能使用不同的字段名）
-            title_patterns = [
-                r'"title"\s*:\s*"([^"]*)"',
-                r'"标题"\s*:\s*"([^"]*)"',
-                r'"章节"\s*:\s*"([^"]*)"'
-            ]
-            
-            time_patterns = [
-                r'"start_time"\s*:\s*"?(\d+(?:\.\d+)?)"?',
-                r'"开始时间"\s*:\s*"?(\d+(?:\.\d+)?)"?',
-                r'"时间"\s*:\s*"?(\d+(?:\.\d+)?)"?'
-            ]
-            
-            # 尝试找到所有可能的章节
-            for title_pattern in title_patterns:
-                title_matches = list(re.finditer(title_pattern, text))
+            # 尝试提取 title 字段（可能使用不同的字段名），找到所有可能的章节
+            for title_re in _LOOSE_TITLE_RES:
+                title_matches = list(title_re.finditer(text))
                 for title_match in title_matches:
                     title = title_match.group(1)
                     # 在标题附近查找时间
@@ -201,8 +239,8 @@ def parse_llm_response(response_text: str) -> List[OutlineEntry]:
                     context_end = min(len(text), title_match.end() + 200)
                     context = text[context_start:context_end]
                     
-                    for time_pattern in time_patterns:
-                        time_match = re.search(time_pattern, context)
+                    for time_re in _LOOSE_TIME_RES:
+                        time_match = time_re.search(context)
                         if time_match:
                             try:
                                 start_time = float(time_match.group(1))
@@ -244,10 +282,40 @@ def extract_outline_list(data: Any) -> List[Dict[str, Any]]:
         elif 'sections' in data:
             return data['sections']
         else:
-            # 如果字典的键都是数字，可能是列表格式的字典
-            if all(str(k).isdigit() for k in data.keys()):
-                return [data[k] for k in sorted(data.keys(), key=int)]
-            return []
+            # 如果字典的键都是数字，可能是列表格式的字典：一次遍历完成检查和整数转换，遇到非数字键立即返回
+            indexed = []
+            for key, value in data.items():
+                key_str = str(key)
+                if not key_str.isdigit():
+                    return []
+                indexed.append((int(key_str), value))
+            indexed.sort(key=_INDEX_KEY)
+            return [value for _, value in indexed]
     else:
         return []
 
+
+
+def parse_batched_llm_response(response_text: str, segment_count: int) -> List[List[Dict[str, Any]]]:
+    """
+    解析批量分段请求的响应 {"segments": [[...], [...], ...]}，按段顺序返回各段的大纲
+    
+    不做正则回退：格式不合法、段数不符或任一段没有章节时返回空列表，由调用方回退到逐段请求
+    （部分段为空的结果不会被当作有效响应写入响应缓存）
+    """
+    try:
+        data = fast_json_loads(_strip_code_fence(response_text))
+    except json.JSONDecodeError as e:
+        logger.warning(f"批量响应不是合法 JSON: {e}")
+        return []
+    
+    segments = data.get('segments') if isinstance(data, dict) else data
+    if not isinstance(segments, list) or len(segments) != segment_count:
+        logger.warning(f"批量响应段数不符：期望 {segment_count} 段")
+        return []
+    
+    segment_outlines = [extract_outline_list(segment) for segment in segments]
+    if not all(segment_outlines):
+        logger.warning(f"批量响应中有 {segment_outlines.count([])} 段没有章节")
+        return []
+    return segment_outlines
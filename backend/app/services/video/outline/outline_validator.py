@@ -4,119 +4,216 @@
 职责：验证大纲时间信息，确保覆盖整个视频
 """
 import logging
-from typing import List, Dict, Any
+from bisect import bisect_right
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import List, Dict, Any, Optional
 
 from app.core.types import SubtitleEntry, OutlineEntry
+from app.utils.json_utils import fast_json_loads
 
 logger = logging.getLogger(__name__)
 
+# 章节排序键（C 实现，避免每个元素一次 lambda 调用）
+_START_TIME_KEY = itemgetter('start_time')
 
-def validate_and_fill_times(
+# 拼接字幕文本时使用的分隔符（标题/描述中不会出现，保证匹配不会跨越两条字幕）
+_TEXT_SEPARATOR = '\x00'
+
+# 没有标题的章节显示的标题（按标题匹配时间之后才填入，匹配时使用原始的空标题）
+_DEFAULT_TITLE = '未知章节'
+
+
+@dataclass
+class _SubtitleColumns:
+    """字幕列式视图（SoA）：热路径按下标访问平行列表，避免逐条字典查找"""
+    starts: List[float]  # 每条字幕的开始时间
+    joined_text: str  # 全部字幕小写文本的拼接
+    offsets: List[int]  # 每条字幕在 joined_text 中的起始偏移
+
+
+def _build_subtitle_columns(subtitles: List[SubtitleEntry]) -> _SubtitleColumns:
+    """将字幕列表一次性拆成平行列，文本小写后拼接为一个字符串"""
+    starts = [subtitle['start_time'] for subtitle in subtitles]
+    texts = [subtitle.get('text', '').lower() for subtitle in subtitles]
+    offsets = []
+    pos = 0
+    for text in texts:
+        offsets.append(pos)
+        pos += len(text) + 1
+    return _SubtitleColumns(starts, _TEXT_SEPARATOR.join(texts), offsets)
+
+
+def _find_first_matching_start(
+    columns: _SubtitleColumns,
+    needles: List[str]
+) -> Optional[float]:
+    """
+    在拼接文本中查找任一关键词最早出现的位置，返回对应字幕的开始时间
+    
+    每个关键词只做一次 C 层的 str.find 扫描，代替逐条字幕的 in 判断
+    """
+    joined = columns.joined_text
+    first_pos = -1
+    for needle in needles:
+        pos = joined.find(needle)
+        if pos >= 0 and (first_pos < 0 or pos < first_pos):
+            first_pos = pos
+    if first_pos < 0:
+        return None
+    return columns.starts[bisect_right(columns.offsets, first_pos) - 1]
+
+
+def _parse_key_points_string(key_points: str) -> List[str]:
+    """字符串形式的 key_points：先尝试按 JSON 数组解析，失败则按逗号分割"""
+    try:
+        parsed = fast_json_loads(key_points)
+        if isinstance(parsed, list):
+            return parsed
+    except ValueError:
+        pass
+    # 如果解析失败（或解析结果不是数组），按逗号分割
+    return [p.strip() for p in key_points.split(',') if p.strip()]
+
+
+# 按 key_points 的类型分派规整函数，未列出的类型（None、数字等）一律视为空数组
+_KEY_POINTS_NORMALIZERS = {
+    list: lambda key_points: key_points,
+    str: _parse_key_points_string,
+    tuple: list,
+}
+
+
+def _empty_key_points(_key_points: Any) -> List[str]:
+    return []
+
+
+def _normalize_key_points(key_points: Any) -> List[str]:
+    """确保 key_points 是数组格式"""
+    return _KEY_POINTS_NORMALIZERS.get(type(key_points), _empty_key_points)(key_points)
+
+
+def coerce_start_time(value: Any) -> float:
+    """
+    将 LLM 返回的 start_time 统一转换为 float
+    
+    模型偶尔返回字符串数字（如 "120"），入口处转换一次，后续比较和运算都是 float 之间进行；
+    无法转换时取 0，交给 _fill_times 按标题/描述匹配时间
+    """
+    if type(value) is float:
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_outline_entry(item: Dict[str, Any]) -> OutlineEntry:
+    """
+    将 LLM 返回的章节字典规整为 OutlineEntry 结构（end_time 由 _fill_times 补充）
+    
+    标题保留原始值（缺失时为空字符串），_fill_times 按原始标题匹配时间后再填入默认标题
+    """
+    return {
+        'title': item.get('title') or '',
+        'start_time': coerce_start_time(item.get('start_time', 0)),
+        'description': item.get('description', ''),
+        'key_points': _normalize_key_points(item.get('key_points', [])),  # 关键知识点/内容点（确保是数组）
+    }
+
+
+def _clamp_start_time(
+    start_time: float,
+    video_end_time: float,
+    overflow_start_time: float
+) -> float:
+    """确保开始时间在有效范围内：小于 0 取 0，超过视频结束时间取 overflow_start_time"""
+    # 绝大多数章节时间有效：一次链式比较直接返回
+    if 0 <= start_time <= video_end_time:
+        return float(start_time)
+    return 0.0 if start_time < 0 else overflow_start_time
+
+
+def _fill_times(
     outline: List[OutlineEntry],
     subtitles: List[SubtitleEntry]
 ) -> List[OutlineEntry]:
-    """验证和补充时间信息，确保覆盖整个视频"""
+    """
+    在已规整的章节上原地校正开始时间并补充结束时间
+    
+    调用方保证 outline 中的每一项都由 _to_outline_entry 生成，这里不再重建字典；
+    没有标题的章节在时间匹配之后填入默认标题
+    """
     if not subtitles:
+        for item in outline:
+            if not item['title']:
+                item['title'] = _DEFAULT_TITLE
         return outline
     
     video_end_time = subtitles[-1].get('end_time', 0)
-    result: List[OutlineEntry] = []
     
     # 如果大纲为空或最后一个章节的时间点太早，记录警告
     if outline:
-        last_time = max(item.get('start_time', 0) for item in outline)
+        last_time = max(item['start_time'] for item in outline)
         if last_time < video_end_time * 0.7:  # 如果最后一个章节不到视频70%的位置
             logger.warning(
                 f"[OutlineValidator] 大纲可能未覆盖整个视频："
                 f"最后一个章节时间 {last_time:.1f}s，视频结束时间 {video_end_time:.1f}s"
             )
     
+    # 字幕列式视图按需构建：大多数章节时间有效，无需匹配
+    columns: Optional[_SubtitleColumns] = None
+    
+    last_index = len(outline) - 1
+    
+    # 超过视频结束时间的章节调整到倒数5-10%的时间段（至少提前1分钟或10%），对所有章节相同，循环外计算一次
+    overflow_start_time = float(max(video_end_time * 0.9, video_end_time - 60))
+    
+    # 第一遍：确定每个章节的开始时间（第二遍据此直接取下一章节的开始时间作为结束时间）
     for item in outline:
-        start_time = item.get('start_time', 0)
+        start_time = item['start_time']
         
         # 如果时间不在字幕范围内，尝试根据描述匹配
         if start_time == 0 or start_time > video_end_time:
             # 根据标题或描述在字幕中查找匹配的时间点
-            title = item.get('title', '')
-            description = item.get('description', '')
-            for subtitle in subtitles:
-                subtitle_text = subtitle.get('text', '').lower()
-                if title.lower() in subtitle_text or (description and description.lower() in subtitle_text):
-                    start_time = subtitle['start_time']
-                    break
+            title = item['title']
+            description = item['description']
+            if columns is None:
+                columns = _build_subtitle_columns(subtitles)
+            needles = [title.lower()]
+            if description:
+                needles.append(description.lower())
+            matched_start = _find_first_matching_start(columns, needles)
+            if matched_start is not None:
+                start_time = matched_start
         
-        # 确保时间在有效范围内
-        if start_time < 0:
-            start_time = 0
-        if start_time > video_end_time:
-            # 如果超过视频结束时间，调整到合理位置（倒数5-10%的时间段）
-            start_time = max(video_end_time * 0.9, video_end_time - 60)  # 至少提前1分钟或10%
-        
-        # 检查是否是最后一个章节，如果是，确保不是最后一秒
-        is_last_chapter = (item == outline[-1]) if outline else False
-        if is_last_chapter:
-            # 最后一个章节应该在倒数5-15%的时间段，不能是最后一秒
-            min_last_time = video_end_time * 0.85
-            max_last_time = video_end_time * 0.95
-            if start_time >= video_end_time * 0.98:  # 如果太接近结束（98%以后）
-                # 调整到合理位置
-                start_time = max(min_last_time, video_end_time * 0.9)
-                logger.warning(
-                    f"[OutlineValidator] 最后一个章节时间 {start_time:.1f}s 太接近结束，"
-                    f"调整为 {start_time:.1f}s"
-                )
-        
-        # 计算结束时间（下一个章节的开始时间，或视频结束时间）
-        end_time = None
-        if result:
-            # 如果已有结果，当前章节的结束时间是下一个章节的开始时间
-            pass  # 会在后面处理
-        else:
-            # 第一个章节，查找下一个章节的开始时间
-            next_item = None
-            for next_outline in outline:
-                if next_outline.get('start_time', 0) > start_time:
-                    next_item = next_outline
-                    break
-            if next_item:
-                end_time = next_item.get('start_time', 0)
-            elif subtitles:
-                end_time = subtitles[-1].get('end_time', start_time + 60)
-        
-        # 确保 key_points 是数组格式
-        key_points = item.get('key_points', [])
-        if isinstance(key_points, str):
-            # 如果是字符串，尝试解析为数组
-            try:
-                import json
-                key_points = json.loads(key_points)
-            except:
-                # 如果解析失败，按逗号分割
-                key_points = [p.strip() for p in key_points.split(',') if p.strip()]
-        elif not isinstance(key_points, list):
-            # 如果不是列表，转换为列表
-            key_points = []
-        
-        result.append({
-            'title': item.get('title', '未知章节'),
-            'start_time': float(start_time),
-            'description': item.get('description', ''),
-            'key_points': key_points,  # 关键知识点/内容点（确保是数组）
-            'end_time': float(end_time) if end_time else None
-        })
-    
-    # 补充结束时间
-    for i, item in enumerate(result):
-        if not item.get('end_time'):
-            if i < len(result) - 1:
-                item['end_time'] = result[i + 1]['start_time']
-            elif subtitles:
-                item['end_time'] = subtitles[-1].get('end_time', item['start_time'] + 60)
-            else:
-                item['end_time'] = item['start_time'] + 60
+        item['start_time'] = _clamp_start_time(start_time, video_end_time, overflow_start_time)
+        if not item['title']:
+            item['title'] = _DEFAULT_TITLE
+    
+    # 检查最后一个章节，确保不是最后一秒（按下标判断：内容相同的两个章节不会都被当成最后一个）
+    if outline:
+        last_item = outline[last_index]
+        # 最后一个章节应该在倒数5-15%的时间段，不能是最后一秒
+        if last_item['start_time'] >= video_end_time * 0.98:  # 如果太接近结束（98%以后）
+            # 调整到合理位置（90% 处）
+            adjusted_start_time = float(video_end_time * 0.9)
+            logger.warning(
+                f"[OutlineValidator] 最后一个章节时间 {last_item['start_time']:.1f}s 太接近结束，"
+                f"调整为 {adjusted_start_time:.1f}s"
+            )
+            last_item['start_time'] = adjusted_start_time
+    
+    # 第二遍：结束时间取严格晚于本章节开始时间的最早开始时间，没有则为视频结束时间
+    # （校正后的开始时间不一定有序，按下标取下一个章节可能得到负时长或零时长）
+    sorted_starts = sorted(item['start_time'] for item in outline)
+    video_end = float(video_end_time)
+    for item in outline:
+        next_index = bisect_right(sorted_starts, item['start_time'])
+        item['end_time'] = sorted_starts[next_index] if next_index < len(sorted_starts) else video_end
     
     # 验证关键点数量（后处理检查）
-    total_key_points = sum(len(item.get('key_points', [])) for item in result)
+    total_key_points = sum(len(item['key_points']) for item in outline)
     video_minutes = video_end_time / 60
     
     if video_minutes <= 15 and total_key_points < 5:
@@ -126,59 +223,73 @@ def validate_and_fill_times(
             f"这可能是由于本地模型（0.5B）理解能力有限导致的。"
         )
     
-    return result
+    return outline
+
+
+def validate_and_fill_times(
+    outline: List[Dict[str, Any]],
+    subtitles: List[SubtitleEntry]
+) -> List[OutlineEntry]:
+    """验证和补充时间信息，确保覆盖整个视频"""
+    if not subtitles:
+        return outline
+    
+    return _fill_times([_to_outline_entry(item) for item in outline], subtitles)
+
+
+def _add_key_points(key_point_set: Dict[Any, Any], key_points: List[Any]) -> None:
+    """
+    将关键点按出现先后加入去重字典（已存在的保留第一次出现的值）
+    
+    模型偶尔返回字典等不可哈希的关键点（如 {"point": "..."}），这类关键点按其 repr 去重
+    """
+    for point in key_points:
+        try:
+            key_point_set.setdefault(point, point)
+        except TypeError:
+            key_point_set.setdefault((type(point), repr(point)), point)
 
 
 def merge_outlines(
     outlines: List[Dict[str, Any]],
-    subtitles: List[Dict[str, Any]]
-) -> List[Dict[str, Any]]:
+    subtitles: List[SubtitleEntry]
+) -> List[OutlineEntry]:
     """合并和去重大纲"""
     if not outlines:
         return []
     
-    # 按时间排序
-    outlines.sort(key=lambda x: x.get('start_time', 0))
+    # 先规整为 OutlineEntry 结构（每个章节只规整一次，保证 start_time 键存在），再按时间排序
+    entries = [_to_outline_entry(item) for item in outlines]
+    entries.sort(key=_START_TIME_KEY)
     
     # 去重：如果两个章节时间太接近（<30秒），合并为一个
-    merged = []
-    for outline in outlines:
-        if not merged:
-            merged.append(outline)
+    # 连续多个章节合并时，描述和关键点先累积在列表/字典中，最后各拼接一次（避免反复重建字符串）
+    merged: List[OutlineEntry] = []
+    description_parts: List[List[str]] = []  # 与 merged 按下标对应
+    # 与 merged 按下标对应（去重键 -> 关键点，dict 保持插入顺序）；只在章节第一次被合并时才构建，
+    # 未合并的章节保持 None，其 key_points 原样保留
+    key_point_sets: List[Optional[Dict[Any, Any]]] = []
+    for outline in entries:
+        if merged and outline['start_time'] - merged[-1]['start_time'] < 30:
+            # 时间太接近，合并描述和关键点
+            logger.debug(
+                f"[OutlineValidator] 合并章节: {merged[-1]['start_time']:.1f}s 和 {outline['start_time']:.1f}s"
+            )
+            description_parts[-1].append(outline['description'])
+            # 合并并去重（key_points 已在规整时转换为数组）：去重后仍按出现先后排列，相同输入得到相同输出
+            if key_point_sets[-1] is None:
+                key_point_sets[-1] = {}
+                _add_key_points(key_point_sets[-1], merged[-1]['key_points'])
+            _add_key_points(key_point_sets[-1], outline['key_points'])
         else:
-            last_outline = merged[-1]
-            last_time = last_outline.get('start_time', 0)
-            current_time = outline.get('start_time', 0)
-            
-            if current_time - last_time < 30:
-                # 时间太接近，合并描述和关键点
-                logger.debug(f"[OutlineValidator] 合并章节: {last_time:.1f}s 和 {current_time:.1f}s")
-                last_outline['description'] = f"{last_outline.get('description', '')} | {outline.get('description', '')}"
-                
-                # 确保 key_points 是数组格式
-                last_key_points = last_outline.get('key_points', [])
-                current_key_points = outline.get('key_points', [])
-                
-                # 如果 key_points 是字符串，转换为数组
-                if isinstance(last_key_points, str):
-                    last_key_points = [p.strip() for p in last_key_points.split(',') if p.strip()]
-                if isinstance(current_key_points, str):
-                    current_key_points = [p.strip() for p in current_key_points.split(',') if p.strip()]
-                
-                # 合并并去重
-                if not isinstance(last_key_points, list):
-                    last_key_points = []
-                if not isinstance(current_key_points, list):
-                    current_key_points = []
-                
-                last_outline['key_points'] = list(set(
-                    last_key_points + current_key_points
-                ))
-            else:
-                merged.append(outline)
-    
-    # 验证和补充时间信息
-    merged = validate_and_fill_times(merged, subtitles)
-    
-    return merged
-
+            merged.append(outline)
+            description_parts.append([outline['description']])
+            key_point_sets.append(None)
+    
+    for outline, descriptions, key_points in zip(merged, description_parts, key_point_sets):
+        if key_points is not None:
+            outline['description'] = ' | '.join(map(str, descriptions))
+            outline['key_points'] = list(key_points.values())
+    
+    # 验证和补充时间信息：合并结果已是规整后的新字典，直接原地补充，不再重建
+    return _fill_times(merged, subtitles)
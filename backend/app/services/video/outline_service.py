@@ -2,6 +2,7 @@
 视频内容大纲提取服务
 基于字幕内容，使用 LLM 提取视频章节/主题
 """
+import asyncio
 import logging
 from typing import List, Optional, Callable
 from pathlib import Path
@@ -9,8 +10,18 @@ from pathlib import Path
 from app.core.config import settings
 from app.core.types import OutlineEntry
 from app.services.video.subtitle_parser import SubtitleParser
-from app.services.video.outline.outline_llm import llm_extract_outline
+from app.services.video.outline.outline_llm import (
+    OUTLINE_PROMPT_VERSION,
+    SINGLE_PASS_TOKEN_BUDGET,
+    llm_extract_outline,
+)
 from app.services.video.outline.outline_validator import merge_outlines
+from app.services.video.outline.outline_cache import (
+    build_outline_cache_key,
+    load_cached_outline,
+    save_cached_outline,
+)
+from app.utils.token_utils import max_chars_for_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -36,38 +47,73 @@ class OutlineService:
             List[OutlineEntry]: 大纲列表，每个条目包含 {title, start_time, description, key_points}
         """
         try:
-            # 1. 解析字幕文件
-            subtitle_path = Path(settings.STORAGE_ROOT) / subtitle_url.lstrip('/')
-            if not subtitle_path.exists():
-                # 尝试从 uploads 目录查找
-                subtitle_path = Path(settings.UPLOAD_SUBTITLE_DIR) / Path(subtitle_url).name
-                if not subtitle_path.exists():
-                    logger.warning(f"字幕文件不存在: {subtitle_url}")
-                    return []
+            # 1. 解析字幕文件：先按存储路径、再从 uploads 目录查找，
+            #    直接尝试解析（文件不存在时捕获 FileNotFoundError），不额外 stat
+            subtitle_path = None
+            subtitles = None
+            for candidate in (
+                Path(settings.STORAGE_ROOT) / subtitle_url.lstrip('/'),
+                Path(settings.UPLOAD_SUBTITLE_DIR) / Path(subtitle_url).name,
+            ):
+                try:
+                    # 解析字幕是同步磁盘读取 + CPU 解析，放到线程中执行，避免阻塞事件循环
+                    subtitles = await asyncio.to_thread(SubtitleParser.parse_subtitle_file, str(candidate))
+                except FileNotFoundError:
+                    continue
+                subtitle_path = candidate
+                break
             
-            subtitles = SubtitleParser.parse_subtitle_file(str(subtitle_path))
+            if subtitle_path is None:
+                logger.warning(f"字幕文件不存在: {subtitle_url}")
+                return []
             if not subtitles:
                 logger.warning(f"字幕文件为空: {subtitle_url}")
                 return []
             
-            # 2. 提取文本内容
-            full_text = SubtitleParser.extract_text_only(subtitles)
+            # 2. 提取文本内容：单次模式的 token 预算最多容纳的字符数，多取 1 个字符即可判断是否超长
+            #    （分段模式按段重新提取文本）
+            full_text = SubtitleParser.extract_text_only(
+                subtitles,
+                max_length=max_chars_for_tokens(SINGLE_PASS_TOKEN_BUDGET) + 1
+            )
             if len(full_text) < 50:  # 文本太短，无法提取大纲
                 return []
             
-            # 3. 使用 LLM 提取大纲
-            if progress_callback:
-                await progress_callback(10, "开始分析字幕内容...")
+            # 3. 查询大纲缓存（同一字幕 + 同一模型 + 同一提示词版本）
+            cache_key = None
+            outline = None
+            if settings.OUTLINE_CACHE_ENABLED:
+                try:
+                    # 计算文件哈希和读取缓存都是同步磁盘 IO，同样放到线程中执行
+                    cache_key = await asyncio.to_thread(
+                        build_outline_cache_key, str(subtitle_path), OUTLINE_PROMPT_VERSION
+                    )
+                    outline = await asyncio.to_thread(load_cached_outline, cache_key)
+                except OSError as e:
+                    logger.warning(f"计算大纲缓存键失败 (video_id={video_id}): {e}")
+                if outline:
+                    logger.info(f"命中大纲缓存 (video_id={video_id})，跳过 LLM 调用")
             
-            outline = await llm_extract_outline(
-                full_text, 
-                subtitles,
-                progress_callback=progress_callback
-            )
+            # 4. 使用 LLM 提取大纲（未命中缓存时）
+            if not outline:
+                if progress_callback:
+                    await progress_callback(10, "开始分析字幕内容...")
+                
+                outline, complete = await llm_extract_outline(
+                    full_text, 
+                    subtitles,
+                    progress_callback=progress_callback
+                )
+                
+                # 缓存 LLM 原始结果，命中时仍走下面的合并与时间校验
+                # （有分段失败的不完整结果不缓存，下次请求重新生成）
+                if outline and complete and cache_key:
+                    await asyncio.to_thread(save_cached_outline, cache_key, outline)
             
-            # 4. 合并和优化大纲（如果是分段处理，需要合并）
+            # 5. 合并和优化大纲（如果是分段处理，需要合并）
+            #    排序、去重和按标题在字幕中匹配时间都是纯 CPU 计算，放到线程中执行，不阻塞其他请求
             if outline:
-                outline = merge_outlines(outline, subtitles)
+                outline = await asyncio.to_thread(merge_outlines, outline, subtitles)
             
             if progress_callback:
                 await progress_callback(100, f"大纲生成完成，共 {len(outline) if outline else 0} 个章节")
@@ -3,15 +3,49 @@
 支持 SRT、VTT、JSON、ASS 格式
 """
 import re
-import json
 import logging
-from typing import List
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
 
 from app.core.types import SubtitleEntry
+from app.utils.json_utils import fast_json_loads
 
 logger = logging.getLogger(__name__)
 
+# VTT 时间轴行：00:00:00.000 --> 00:00:05.000（模块加载时编译一次）
+_VTT_TIME_RE = re.compile(r'(\d{2}:\d{2}:\d{2}\.\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2}\.\d{3})')
+# ASS 对白行：Layer,Start,End,Style,Name,MarginL,MarginR,MarginV,Effect,Text，文本是第 10 个字段
+_ASS_TEXT_FIELD_INDEX = 9
+# ASS 样式覆盖标签（如 {\pos(10,20)}）和换行/硬空格转义
+_ASS_OVERRIDE_TAG_RE = re.compile(r'\{[^}]*\}')
+_ASS_LINE_BREAK_RE = re.compile(r'\\[Nnh]')
+
+# JSON 字幕字段名（按优先级排列，取第一个存在的字段）
+_BILIBILI_START_KEYS = ('from', 'start', 'start_time')
+_BILIBILI_END_KEYS = ('to', 'end', 'end_time')
+_BILIBILI_TEXT_KEYS = ('content', 'text')
+_START_KEYS = ('start', 'start_time', 'from')
+_END_KEYS = ('end', 'end_time', 'to')
+_TEXT_KEYS = ('text', 'content')
+_MISSING = object()
+_START_TIME_KEY = itemgetter('start_time')
+
+
+def _first_present(item: Dict[str, Any], keys: Tuple[str, ...], default: Any) -> Any:
+    """按优先级返回第一个存在的字段值（字段存在但值为 None 时同样返回 None），都不存在时返回 default"""
+    for key in keys:
+        value = item.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+    return default
+
+
+# SRT 逐行扫描的状态
+_SRT_EXPECT_INDEX = 0  # 等待序号行
+_SRT_EXPECT_TIME = 1  # 等待时间轴行
+_SRT_COLLECT_TEXT = 2  # 收集文本行，直到空行
+
 
 class SubtitleParser:
     """字幕解析器"""
@@ -27,43 +61,83 @@ class SubtitleParser:
         Returns:
             List[Dict]: 字幕条目列表，每个条目包含 {start_time, end_time, text}
         """
-        path = Path(file_path)
-        if not path.exists():
-            raise FileNotFoundError(f"字幕文件不存在: {file_path}")
-        
-        ext = path.suffix.lower()
-        
-        if ext == '.srt':
-            return SubtitleParser._parse_srt(file_path)
-        elif ext == '.vtt':
-            return SubtitleParser._parse_vtt(file_path)
-        elif ext == '.json':
-            return SubtitleParser._parse_json(file_path)
-        elif ext == '.ass':
-            return SubtitleParser._parse_ass(file_path)
-        else:
+        ext = Path(file_path).suffix.lower()
+        
+        parser = _PARSERS_BY_EXTENSION.get(ext)
+        if parser is None:
             raise ValueError(f"不支持的字幕格式: {ext}")
+        
+        # 直接打开文件，不存在时由 open 抛出（不再先 stat 一次）
+        try:
+            return parser(file_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"字幕文件不存在: {file_path}") from None
     
     @staticmethod
     def _parse_srt(file_path: str) -> List[SubtitleEntry]:
-        """解析 SRT 格式"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        """
+        解析 SRT 格式
         
-        # SRT 格式：序号、时间轴、文本
-        pattern = r'(\d+)\s*\n(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})\s*\n(.*?)(?=\n\d+\s*\n|\n*$)'
-        matches = re.finditer(pattern, content, re.DOTALL)
+        SRT 格式：序号、时间轴、文本（可多行），条目之间以空行分隔。
+        逐行扫描的状态机：等待序号 -> 等待时间轴 -> 收集文本，整个文件只遍历一遍
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
         
         subtitles = []
-        for match in matches:
-            start_time = SubtitleParser._srt_time_to_seconds(match.group(2))
-            end_time = SubtitleParser._srt_time_to_seconds(match.group(3))
-            text = match.group(4).strip().replace('\n', ' ')
+        state = _SRT_EXPECT_INDEX
+        start_time = end_time = 0.0
+        text_lines: List[str] = []
+        last_index = len(lines) - 1
+        
+        for index, line in enumerate(lines):
+            line = line.strip()
             
+            if state == _SRT_COLLECT_TEXT:
+                # 空行结束当前条目；缺少空行分隔时，紧跟时间轴的序号行同样结束当前条目
+                if not line or (
+                    line.isdigit() and index < last_index and '-->' in lines[index + 1]
+                ):
+                    subtitles.append({
+                        'start_time': start_time,
+                        'end_time': end_time,
+                        'text': ' '.join(text_lines)
+                    })
+                    state = _SRT_EXPECT_TIME if line else _SRT_EXPECT_INDEX
+                else:
+                    text_lines.append(line)
+                continue
+            
+            if not line:
+                continue
+            
+            if state == _SRT_EXPECT_INDEX:
+                # 序号行（文件开头可能带 BOM）；其他内容跳过
+                if line.lstrip('\ufeff').isdigit():
+                    state = _SRT_EXPECT_TIME
+                continue
+            
+            # 时间轴行：00:00:00,000 --> 00:00:05,000（结束时间后可能带位置信息）
+            start_str, separator, end_str = line.partition('-->')
+            end_fields = end_str.split()
+            if not separator or not end_fields:
+                state = _SRT_EXPECT_TIME if line.isdigit() else _SRT_EXPECT_INDEX
+                continue
+            try:
+                start_time = SubtitleParser._srt_time_to_seconds(start_str.strip())
+                end_time = SubtitleParser._srt_time_to_seconds(end_fields[0])
+            except ValueError:
+                state = _SRT_EXPECT_INDEX
+                continue
+            text_lines = []
+            state = _SRT_COLLECT_TEXT
+        
+        # 文件末尾没有空行时，最后一条仍在收集中
+        if state == _SRT_COLLECT_TEXT:
             subtitles.append({
                 'start_time': start_time,
                 'end_time': end_time,
-                'text': text
+                'text': ' '.join(text_lines)
             })
         
         return subtitles
@@ -71,35 +145,36 @@ class SubtitleParser:
     @staticmethod
     def _parse_vtt(file_path: str) -> List[SubtitleEntry]:
         """解析 VTT 格式"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
         subtitles = []
         current_subtitle = None
+        current_text_parts: List[str] = []  # 当前条目的文本行，条目结束时拼接一次
         
-        for line in lines:
-            line = line.strip()
-            if not line or line.startswith('WEBVTT') or line.startswith('NOTE'):
-                continue
-            
-            # 时间轴行：00:00:00.000 --> 00:00:05.000
-            time_match = re.match(r'(\d{2}:\d{2}:\d{2}\.\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2}\.\d{3})', line)
-            if time_match:
-                if current_subtitle:
-                    subtitles.append(current_subtitle)
-                start_time = SubtitleParser._vtt_time_to_seconds(time_match.group(1))
-                end_time = SubtitleParser._vtt_time_to_seconds(time_match.group(2))
-                current_subtitle = {
-                    'start_time': start_time,
-                    'end_time': end_time,
-                    'text': ''
-                }
-            elif current_subtitle:
-                if current_subtitle['text']:
-                    current_subtitle['text'] += ' '
-                current_subtitle['text'] += line
+        # 逐行读取文件，不一次性把所有行读入列表
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('WEBVTT') or line.startswith('NOTE'):
+                    continue
+                
+                # 时间轴行：00:00:00.000 --> 00:00:05.000
+                time_match = _VTT_TIME_RE.match(line)
+                if time_match:
+                    if current_subtitle:
+                        current_subtitle['text'] = ' '.join(current_text_parts)
+                        subtitles.append(current_subtitle)
+                    current_text_parts = []
+                    start_time = SubtitleParser._vtt_time_to_seconds(time_match.group(1))
+                    end_time = SubtitleParser._vtt_time_to_seconds(time_match.group(2))
+                    current_subtitle = {
+                        'start_time': start_time,
+                        'end_time': end_time,
+                        'text': ''
+                    }
+                elif current_subtitle:
+                    current_text_parts.append(line)
         
         if current_subtitle:
+            current_subtitle['text'] = ' '.join(current_text_parts)
             subtitles.append(current_subtitle)
         
         return subtitles
@@ -113,8 +188,9 @@ class SubtitleParser:
         2. 标准格式：[{ "start": 1.234, "end": 5.678, "text": "..." }]
         3. 嵌套格式：{ "subtitles": [{ "start_time": 1.234, "end_time": 5.678, "text": "..." }] }
         """
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # 按字节读取后一次解析（已安装 orjson 时使用 C 实现，无需先解码为 str）
+        with open(file_path, 'rb') as f:
+            data = fast_json_loads(f.read())
         
         subtitles = []
         
@@ -124,9 +200,9 @@ class SubtitleParser:
             if isinstance(body, list):
                 for item in body:
                     # bilibili-evolved 使用 from/to/content
-                    from_time = item.get('from', item.get('start', item.get('start_time', 0)))
-                    to_time = item.get('to', item.get('end', item.get('end_time', 0)))
-                    content = item.get('content', item.get('text', ''))
+                    from_time = _first_present(item, _BILIBILI_START_KEYS, 0)
+                    to_time = _first_present(item, _BILIBILI_END_KEYS, 0)
+                    content = _first_present(item, _BILIBILI_TEXT_KEYS, '')
                     
                     if content:  # 只添加有内容的字幕
                         subtitles.append({
@@ -139,9 +215,9 @@ class SubtitleParser:
         elif isinstance(data, list):
             for item in data:
                 if isinstance(item, dict):
-                    start_time = item.get('start', item.get('start_time', item.get('from', 0)))
-                    end_time = item.get('end', item.get('end_time', item.get('to', 0)))
-                    text = item.get('text', item.get('content', ''))
+                    start_time = _first_present(item, _START_KEYS, 0)
+                    end_time = _first_present(item, _END_KEYS, 0)
+                    text = _first_present(item, _TEXT_KEYS, '')
                     
                     if text:  # 只添加有内容的字幕
                         subtitles.append({
@@ -155,9 +231,9 @@ class SubtitleParser:
             subtitle_list = data['subtitles']
             if isinstance(subtitle_list, list):
                 for item in subtitle_list:
-                    start_time = item.get('start', item.get('start_time', item.get('from', 0)))
-                    end_time = item.get('end', item.get('end_time', item.get('to', 0)))
-                    text = item.get('text', item.get('content', ''))
+                    start_time = _first_present(item, _START_KEYS, 0)
+                    end_time = _first_present(item, _END_KEYS, 0)
+                    text = _first_present(item, _TEXT_KEYS, '')
                     
                     if text:  # 只添加有内容的字幕
                         subtitles.append({
@@ -166,44 +242,60 @@ class SubtitleParser:
                             'text': str(text).strip()
                         })
         
-        # 按开始时间排序，确保字幕顺序正确
-        subtitles.sort(key=lambda x: x['start_time'])
+        # 按开始时间排序，确保字幕顺序正确（已有序时 Timsort 只做一次线性扫描；itemgetter 键在 C 层取值）
+        subtitles.sort(key=_START_TIME_KEY)
         
         return subtitles
     
     @staticmethod
     def _parse_ass(file_path: str) -> List[SubtitleEntry]:
-        """解析 ASS 格式（简化版）"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        """
+        解析 ASS/SSA 格式
         
+        对白行：Dialogue: 0,0:00:00.00,0:00:05.00,Default,,0,0,0,,文本内容
+        前 9 个字段以逗号分隔，第 10 个字段（文本）本身可能含逗号，只切分 9 次
+        """
         subtitles = []
-        # ASS 格式：Dialogue: 0,0:00:00.00,0:00:05.00,Default,,0,0,0,,文本内容
-        pattern = r'Dialogue:.*?,\d+:\d{2}:\d{2}\.\d{2},\d+:\d{2}:\d{2}\.\d{2},.*?,,(.*)'
-        matches = re.finditer(pattern, content)
-        
-        for match in matches:
-            # 简化处理：提取时间（需要更复杂的解析）
-            # 这里返回一个简化版本
-            text = match.group(1).strip()
-            if text:
-                subtitles.append({
-                    'start_time': 0,  # ASS 格式需要更复杂的解析
-                    'end_time': 0,
-                    'text': text
-                })
+        with open(file_path, 'r', encoding='utf-8-sig') as f:
+            for line in f:
+                if not line.startswith('Dialogue:'):
+                    continue
+                fields = line[len('Dialogue:'):].split(',', _ASS_TEXT_FIELD_INDEX)
+                if len(fields) <= _ASS_TEXT_FIELD_INDEX:
+                    continue
+                
+                try:
+                    start_time = SubtitleParser._ass_time_to_seconds(fields[1])
+                    end_time = SubtitleParser._ass_time_to_seconds(fields[2])
+                except ValueError:
+                    continue
+                
+                # 去掉 {\...} 样式标签，\N / \n（换行）和 \h（硬空格）替换为空格
+                text = _ASS_OVERRIDE_TAG_RE.sub('', fields[_ASS_TEXT_FIELD_INDEX])
+                text = _ASS_LINE_BREAK_RE.sub(' ', text).strip()
+                if text:
+                    subtitles.append({
+                        'start_time': start_time,
+                        'end_time': end_time,
+                        'text': text
+                    })
+        
+        # 不同图层的对白可能交错出现，按开始时间排序
+        subtitles.sort(key=_START_TIME_KEY)
         
         return subtitles
     
     @staticmethod
     def _srt_time_to_seconds(time_str: str) -> float:
-        """SRT 时间格式转秒数：00:00:00,000"""
-        time_str = time_str.replace(',', '.')
-        parts = time_str.split(':')
-        hours = int(parts[0])
-        minutes = int(parts[1])
-        seconds = float(parts[2])
-        return hours * 3600 + minutes * 60 + seconds
+        """SRT 时间格式转秒数：00:00:00,000（格式不正确时抛出 ValueError）"""
+        hours, minutes, seconds = time_str.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds.replace(',', '.'))
+    
+    @staticmethod
+    def _ass_time_to_seconds(time_str: str) -> float:
+        """ASS 时间格式转秒数：0:00:00.00（格式不正确时抛出 ValueError）"""
+        hours, minutes, seconds = time_str.strip().split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
     
     @staticmethod
     def _vtt_time_to_seconds(time_str: str) -> float:
@@ -215,16 +307,42 @@ class SubtitleParser:
         return hours * 3600 + minutes * 60 + seconds
     
     @staticmethod
-    def extract_text_only(subtitles: List[SubtitleEntry]) -> str:
+    def extract_text_only(
+        subtitles: List[SubtitleEntry],
+        max_length: Optional[int] = None
+    ) -> str:
         """
         提取字幕纯文本（用于 LLM 分析）
         
         Args:
             subtitles: 字幕条目列表
+            max_length: 最大长度（可选），达到后停止拼接，结果等于完整文本的前 max_length 个字符
             
         Returns:
             str: 合并后的文本内容
         """
-        texts = [item['text'] for item in subtitles if item.get('text')]
-        return ' '.join(texts)
+        if max_length is None:
+            texts = [item['text'] for item in subtitles if item.get('text')]
+            return ' '.join(texts)
+        
+        # 只收集到足够长度为止，长视频不必拼接全部字幕
+        texts = []
+        total = 0
+        for item in subtitles:
+            text = item.get('text')
+            if not text:
+                continue
+            texts.append(text)
+            total += len(text) + 1  # 含分隔空格
+            if total > max_length:
+                break
+        return ' '.join(texts)[:max_length]
+
 
+# 扩展名 -> 解析函数（类定义完成后注册）
+_PARSERS_BY_EXTENSION = {
+    '.srt': SubtitleParser._parse_srt,
+    '.vtt': SubtitleParser._parse_vtt,
+    '.json': SubtitleParser._parse_json,
+    '.ass': SubtitleParser._parse_ass,
+}
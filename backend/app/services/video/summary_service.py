@@ -10,23 +10,163 @@
 - 足够精炼，不超过本地模型算力
 - 字幕权重最高，弹幕和评论作为补充
 """
+import asyncio
 import json
 import logging
 import re
-from typing import Dict, Any, Optional, List
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Tuple
 from pathlib import Path
+from sqlalchemy import func, literal, select, union_all, update
 from sqlalchemy.orm import Session
-import httpx
 
 from app.core.config import settings
+from app.core.http_client import get_cloud_http_client, get_local_http_client
 from app.core.database import SessionLocal
 from app.models.video import Video
 from app.models.danmaku import Danmaku
 from app.models.comment import Comment
 from app.services.video.subtitle_parser import SubtitleParser
+from app.utils.json_utils import fast_json_loads
+from app.utils.text_selection import select_salient_text
+from app.utils.token_utils import max_chars_for_tokens, truncate_to_token_budget
 
 logger = logging.getLogger(__name__)
 
+# 弹幕 / 评论合并查询中标记行来源
+_SOURCE_DANMAKU = "danmaku"
+_SOURCE_COMMENT = "comment"
+
+# LLM 响应中的 Markdown 代码块（模块加载时编译一次）
+_FENCED_BLOCK_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)\s*```", re.IGNORECASE)
+_FENCE_MARK_RE = re.compile(r"```json\s*|\s*```", re.IGNORECASE)
+_FENCE_PREFIX_RE = re.compile(r"^```[a-zA-Z]*\s*")
+_FENCE_SUFFIX_RE = re.compile(r"\s*```$")
+
+# 结构化摘要 JSON 解析失败时，从纯文本中按小标题提取各部分（每部分先匹配完整标题，再匹配简称）
+_STRUCTURED_FIELD_RES = {
+    key: [re.compile(pattern, re.DOTALL | re.IGNORECASE) for pattern in patterns]
+    for key, patterns in {
+        "problem_background": [r"问题背景[：:]\s*(.+?)(?=\n|研究方法|主要发现|最终结论|$)", r"背景[：:]\s*(.+?)(?=\n|方法|发现|结论|$)"],
+        "research_methods": [r"研究方法[：:]\s*(.+?)(?=\n|主要发现|最终结论|问题背景|$)", r"方法[：:]\s*(.+?)(?=\n|发现|结论|背景|$)"],
+        "main_findings": [r"主要发现[：:]\s*(.+?)(?=\n|最终结论|问题背景|研究方法|$)", r"发现[：:]\s*(.+?)(?=\n|结论|背景|方法|$)"],
+        "conclusions": [r"最终结论[：:]\s*(.+?)(?=\n|问题背景|研究方法|主要发现|$)", r"结论[：:]\s*(.+?)(?=\n|背景|方法|发现|$)"],
+    }.items()
+}
+
+# 提示词模板（模块加载时构建一次，调用时只填入视频内容）。
+# 摘要 / 知识点提示词都以视频内容开头、任务说明在后：前缀相同，
+# 模型服务端（Ollama / llama.cpp 的 prompt cache、云端上下文缓存）可复用已编码的前缀
+
+# 简短摘要（50-100字）
+_SHORT_SUMMARY_PROMPT = """视频内容：
+{content}
+
+请基于以上视频内容，生成一段50-100字的简短摘要，要求：
+1. 精炼概括视频核心内容
+2. 突出视频主题和要点
+3. 语言简洁流畅
+
+请只返回摘要文本，不要包含其他说明："""
+
+# 详细摘要（200-300字）
+_DETAILED_SUMMARY_PROMPT = """视频内容：
+{content}
+
+请基于以上视频内容，生成一段200-300字的详细摘要，要求：
+1. 详细概括视频主要内容
+2. 包含关键信息和要点
+3. 语言流畅，结构清晰
+
+请只返回摘要文本，不要包含其他说明："""
+
+# 一次请求同时生成简短摘要、详细摘要和核心知识点
+_FUSED_SUMMARY_PROMPT = """视频内容：
+{content}
+
+请基于以上视频内容，完成三项任务：
+1. **简短摘要**：50-100字，精炼概括视频核心内容，突出主题和要点
+2. **详细摘要**：200-300字，详细概括主要内容，包含关键信息，结构清晰
+3. **核心知识点**：
+   - 概念：3-5个关键概念或术语
+   - 步骤：3-5个关键步骤或流程（如果有）
+   - 数据：3-5个关键数据、统计或事实（如果有）
+   - 观点：3-5个重要观点或结论（如果有）
+
+请以严格的JSON格式返回（不要包含Markdown标记）：
+{{
+    "short": "简短摘要",
+    "detailed": "详细摘要",
+    "knowledge_points": {{
+        "concepts": ["概念1", "概念2"],
+        "steps": ["步骤1", "步骤2"],
+        "data": ["数据1", "数据2"],
+        "opinions": ["观点1", "观点2"]
+    }}
+}}
+
+如果某个类别没有相关内容，请返回空数组 []。"""
+
+# 核心知识点
+_KNOWLEDGE_PROMPT = """视频内容：
+{content}
+
+请基于以上视频内容，提取核心知识点，要求：
+1. **概念**：提取3-5个关键概念或术语
+2. **步骤**：提取3-5个关键步骤或流程（如果有）
+3. **数据**：提取3-5个关键数据、统计或事实（如果有）
+4. **观点**：提取3-5个重要观点或结论（如果有）
+
+请以严格的JSON格式返回（不要包含Markdown标记）：
+{{
+    "concepts": ["概念1", "概念2"],
+    "steps": ["步骤1", "步骤2"],
+    "data": ["数据1", "数据2"],
+    "opinions": ["观点1", "观点2"]
+}}
+
+如果某个类别没有相关内容，请返回空数组 []。"""
+
+# 结构化摘要（实时生成，不保存）
+_STRUCTURED_SUMMARY_PROMPT = """请基于以下视频内容，生成结构化摘要，包含以下四个部分：
+
+1. **问题背景**：视频要解决的核心问题或讨论的背景
+2. **研究方法**：视频中采用的研究方法、分析思路或技术手段
+3. **主要发现**：视频中发现的重要信息、数据或观点
+4. **最终结论**：视频得出的结论或总结
+
+请以JSON格式返回，格式如下：
+{{
+    "problem_background": "问题背景内容",
+    "research_methods": "研究方法内容",
+    "main_findings": "主要发现内容",
+    "conclusions": "最终结论内容"
+}}
+
+**重要：只返回JSON对象，不要包含任何Markdown标记或其他说明文字。**
+
+视频内容：
+{content}
+"""
+
+
+@lru_cache(maxsize=256)
+def _load_subtitle_text(path: str, mtime_ns: int, size: int, max_tokens: int) -> str:
+    """
+    解析字幕并压缩到 max_tokens（估算 token 数）以内
+    
+    按 (路径, 修改时间, 大小) 缓存：重新生成同一视频的摘要时不再读盘和解析，
+    字幕文件被替换后缓存键随之变化，自动失效
+    """
+    subtitles = SubtitleParser.parse_subtitle_file(path)
+    if not subtitles:
+        return ""
+    # 超长时按与全文主题的相关度挑选字幕句子（覆盖整个视频），而不是只保留开头部分
+    return select_salient_text(
+        [item['text'] for item in subtitles if item.get('text')],
+        max_tokens
+    )
+
 
 class SummaryService:
     """视频摘要生成服务"""
@@ -37,16 +177,28 @@ class SummaryService:
     WEIGHT_COMMENT = 0.1   # 评论权重 10%
     
     # 内容长度限制（避免超出模型算力）
-    MAX_SUBTITLE_LENGTH = 2000  # 字幕最多2000字符
+    # 文本按估算 token 数限制（token_utils）：中文约 1 字 1 token，英文约 4 字符 1 token，
+    # 同样的预算下英文内容可以保留更多字符
+    MAX_SUBTITLE_TOKENS = 2000  # 字幕最多2000 token
     MAX_DANMAKU_COUNT = 50      # 弹幕最多50条
     MAX_COMMENT_COUNT = 20      # 评论最多20条
+    MAX_WEIGHTED_CONTENT_TOKENS = 2500   # 提示词中的加权内容最多2500 token
+    MAX_KNOWLEDGE_CONTENT_TOKENS = 2000  # 单独提取知识点时最多2000 token
     
-    async def generate_summary(self, video_id: int) -> Dict[str, Any]:
+    # 内容过短时不调用 LLM（结果只会是空洞或编造的内容，白白消耗一次推理）
+    MIN_SUMMARY_CONTENT_LENGTH = 80     # 加权内容少于80字符不生成摘要
+    MIN_KNOWLEDGE_CONTENT_LENGTH = 200  # 加权内容少于200字符不提取知识点
+    
+    async def generate_summary(self, video_id: int, db: Optional[Session] = None) -> Dict[str, Any]:
         """
         生成视频摘要和核心知识点
         
         Args:
             video_id: 视频ID
+            db: 调用方的数据库会话（可选）。传入时复用该会话，只执行 UPDATE 不提交、不关闭，
+                事务由调用方负责，出错时异常直接抛给调用方（由其回滚）；
+                不传时自行创建会话并在结束时提交、关闭，出错时返回空字典。
+                注意：BackgroundTasks 中不要传入请求的会话（请求结束后会话即被关闭）
             
         Returns:
             Dict: {
@@ -60,28 +212,41 @@ class SummaryService:
                 }
             }
         """
-        db = SessionLocal()
+        owns_session = db is None
+        if owns_session:
+            db = SessionLocal()
         try:
-            video = db.query(Video).filter(Video.id == video_id).first()
+            # 1. 收集内容（字幕、弹幕、评论）
+            #    同步数据库查询和字幕解析放到线程中执行，避免阻塞事件循环
+            video, content_data = await asyncio.to_thread(self._load_video_content, db, video_id)
             if not video:
                 logger.error(f"视频不存在: video_id={video_id}")
                 return {}
             
-            # 1. 收集内容（字幕、弹幕、评论）
-            content_data = self._collect_content(video, db)
-            
-            if not content_data.get("subtitle_text") and not content_data.get("danmaku_text") and not content_data.get("comment_text"):
+            # 构建加权内容（字幕权重最高），后续各个提示词共用同一份（构建时即限制总长度，避免超出模型算力）
+            weighted_content = self._build_weighted_content(content_data, self.MAX_WEIGHTED_CONTENT_TOKENS)
+            if not weighted_content:
                 logger.warning(f"视频 {video_id} 无可用内容，无法生成摘要")
                 return {}
             
-            # 2. 生成摘要
-            summary_result = await self._generate_summary_text(content_data)
-            
-            # 3. 提取核心知识点
-            knowledge_points = await self._extract_knowledge_points(content_data)
+            # 2. 生成摘要 + 3. 提取核心知识点：优先合并为一次请求（视频内容只编码一次）
+            #    内容不足以提取知识点时不走合并请求，只单独生成摘要
+            fused = None
+            if settings.SUMMARY_FUSED_PROMPT and len(weighted_content) >= self.MIN_KNOWLEDGE_CONTENT_LENGTH:
+                fused = await self._generate_summary_and_knowledge(weighted_content)
+            if fused:
+                summary_result, knowledge_points = fused
+            else:
+                # 合并请求未启用或结果不可用：分开请求，两者互不依赖，并发执行
+                summary_result, knowledge_points = await asyncio.gather(
+                    self._generate_summary_text(weighted_content),
+                    self._extract_knowledge_points(weighted_content),
+                )
             
-            # 4. 保存到数据库
-            self._save_summary_to_db(db, video, summary_result, knowledge_points)
+            # 4. 保存到数据库（同样是阻塞调用，放到线程中执行）
+            await asyncio.to_thread(
+                self._save_summary_to_db, db, video, summary_result, knowledge_points, owns_session
+            )
             
             return {
                 "summary_short": summary_result.get("short", ""),
@@ -91,9 +256,19 @@ class SummaryService:
             
         except Exception as e:
             logger.error(f"生成视频摘要失败 (video_id={video_id}): {e}", exc_info=True)
+            if not owns_session:
+                raise
             return {}
         finally:
-            db.close()
+            if owns_session:
+                db.close()
+    
+    def _load_video_content(self, db: Session, video_id: int) -> Tuple[Optional[Video], Dict[str, Any]]:
+        """查询视频并收集内容（同步，在线程中调用）"""
+        video = db.query(Video).filter(Video.id == video_id).first()
+        if not video:
+            return None, {}
+        return video, self._collect_content(video, db)
     
     def _collect_content(self, video: Video, db: Session) -> Dict[str, Any]:
         """收集字幕、弹幕、评论内容"""
@@ -109,52 +284,86 @@ class SummaryService:
         # 1. 解析字幕（权重最高）
         if video.subtitle_url:
             try:
-                subtitle_path = Path(settings.STORAGE_ROOT) / video.subtitle_url.lstrip('/')
-                if not subtitle_path.exists():
-                    subtitle_path = Path(settings.UPLOAD_SUBTITLE_DIR) / Path(video.subtitle_url).name
-                
-                if subtitle_path.exists():
-                    subtitles = SubtitleParser.parse_subtitle_file(str(subtitle_path))
-                    if subtitles:
-                        subtitle_text = SubtitleParser.extract_text_only(subtitles)
-                        # 限制长度
-                        if len(subtitle_text) > self.MAX_SUBTITLE_LENGTH:
-                            subtitle_text = subtitle_text[:self.MAX_SUBTITLE_LENGTH] + "..."
+                # 先按存储路径、再从 uploads 目录查找；stat 结果同时作为缓存键的一部分
+                for subtitle_path in (
+                    Path(settings.STORAGE_ROOT) / video.subtitle_url.lstrip('/'),
+                    Path(settings.UPLOAD_SUBTITLE_DIR) / Path(video.subtitle_url).name,
+                ):
+                    try:
+                        stat = subtitle_path.stat()
+                    except (FileNotFoundError, NotADirectoryError):
+                        continue
+                    subtitle_text = _load_subtitle_text(
+                        str(subtitle_path), stat.st_mtime_ns, stat.st_size, self.MAX_SUBTITLE_TOKENS
+                    )
+                    if subtitle_text:
                         content_data["subtitle_text"] = subtitle_text
                         content_data["subtitle_length"] = len(subtitle_text)
+                    break
             except Exception as e:
                 logger.warning(f"解析字幕失败: {e}")
         
-        # 2. 收集弹幕（按时间排序，取前N条）
+        # 2. 收集弹幕（按时间排序，取前N条）和评论（按点赞数排序，取前N条）
+        #    两条查询用 UNION ALL 合并，一次数据库往返取回
         try:
-            danmakus = db.query(Danmaku).filter(
-                Danmaku.video_id == video.id,
-                Danmaku.is_deleted == False
-            ).order_by(Danmaku.video_time).limit(self.MAX_DANMAKU_COUNT).all()
+            danmaku_texts = []
+            comment_texts = []
+            for source, content in db.execute(self._build_content_query(video.id)):
+                # 只 strip 一次：既用于过滤空白内容，也作为拼接的文本
+                text = content.strip() if content else ""
+                if not text:
+                    continue
+                if source == _SOURCE_DANMAKU:
+                    danmaku_texts.append(text)
+                else:
+                    comment_texts.append(text)
             
-            if danmakus:
-                danmaku_texts = [d.content for d in danmakus if d.content and len(d.content.strip()) > 0]
-                content_data["danmaku_text"] = " ".join(danmaku_texts[:self.MAX_DANMAKU_COUNT])
+            # 条数已由查询的 LIMIT 限制，无需再切片
+            if danmaku_texts:
+                content_data["danmaku_text"] = " ".join(danmaku_texts)
                 content_data["danmaku_count"] = len(danmaku_texts)
-        except Exception as e:
-            logger.warning(f"收集弹幕失败: {e}")
-        
-        # 3. 收集评论（按点赞数排序，取前N条）
-        try:
-            comments = db.query(Comment).filter(
-                Comment.video_id == video.id,
-                Comment.is_deleted == False
-            ).order_by(Comment.like_count.desc()).limit(self.MAX_COMMENT_COUNT).all()
-            
-            if comments:
-                comment_texts = [c.content for c in comments if c.content and len(c.content.strip()) > 0]
-                content_data["comment_text"] = " ".join(comment_texts[:self.MAX_COMMENT_COUNT])
+            if comment_texts:
+                content_data["comment_text"] = " ".join(comment_texts)
                 content_data["comment_count"] = len(comment_texts)
         except Exception as e:
-            logger.warning(f"收集评论失败: {e}")
+            logger.warning(f"收集弹幕和评论失败: {e}")
         
         return content_data
 
+    def _build_content_query(self, video_id: int):
+        """
+        构建弹幕 + 评论的 UNION ALL 查询，返回 (source, content) 行
+        
+        各分支内的 ORDER BY + LIMIT 只决定取哪些行，UNION 结果本身无序，
+        所以另带一列排序键，在外层按 (source, sort_key) 排序：
+        弹幕按视频时间升序，评论按点赞数降序（取负数后升序）
+        
+        两个分支分别由 danmakus.idx_video_deleted_time 和 comments.idx_video_deleted_like
+        覆盖（列顺序与 WHERE + ORDER BY 一致），按索引顺序读到 LIMIT 条即停止，不需要排序
+        """
+        danmaku_stmt = select(
+            literal(_SOURCE_DANMAKU).label("source"),
+            Danmaku.content.label("content"),
+            Danmaku.video_time.label("sort_key"),
+        ).where(
+            Danmaku.video_id == video_id,
+            Danmaku.is_deleted == False
+        ).order_by(Danmaku.video_time).limit(self.MAX_DANMAKU_COUNT)
+        
+        comment_stmt = select(
+            literal(_SOURCE_COMMENT).label("source"),
+            Comment.content.label("content"),
+            (-func.coalesce(Comment.like_count, 0)).label("sort_key"),
+        ).where(
+            Comment.video_id == video_id,
+            Comment.is_deleted == False
+        ).order_by(Comment.like_count.desc()).limit(self.MAX_COMMENT_COUNT)
+        
+        combined = union_all(danmaku_stmt, comment_stmt).subquery()
+        return select(combined.c.source, combined.c.content).order_by(
+            combined.c.source, combined.c.sort_key
+        )
+
     def _get_cloud_summary_config(self) -> Optional[Dict[str, str]]:
         api_key = getattr(settings, "SUMMARY_API_KEY", "") or settings.LLM_API_KEY
         base_url = (getattr(settings, "SUMMARY_BASE_URL", "") or settings.LLM_BASE_URL).rstrip("/")
@@ -185,12 +394,13 @@ class SummaryService:
             "max_tokens": max_tokens,
         }
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                resp = await client.post(
-                    f"{cfg['base_url']}/chat/completions",
-                    json=payload,
-                    headers=headers,
-                )
+            # 复用进程内共享的连接池（keep-alive / HTTP/2），不再每次调用重新握手
+            resp = await get_cloud_http_client().post(
+                f"{cfg['base_url']}/chat/completions",
+                json=payload,
+                headers=headers,
+                timeout=60.0,
+            )
             if resp.status_code != 200:
                 logger.warning("Summary cloud call failed: %s - %s", resp.status_code, resp.text)
                 return None
@@ -212,11 +422,12 @@ class SummaryService:
         }
         timeout = max(float(getattr(settings, "LOCAL_LLM_TIMEOUT", 60.0) or 60.0), 60.0)
         try:
-            async with httpx.AsyncClient(timeout=timeout, trust_env=False) as client:
-                resp = await client.post(
-                    f"{cfg['base_url']}/chat/completions",
-                    json=payload,
-                )
+            # 本地共享客户端已设置 trust_env=False（不走系统代理）
+            resp = await get_local_http_client().post(
+                f"{cfg['base_url']}/chat/completions",
+                json=payload,
+                timeout=timeout,
+            )
             if resp.status_code != 200:
                 logger.warning("Summary local call failed: %s - %s", resp.status_code, resp.text)
                 return None
@@ -248,31 +459,40 @@ class SummaryService:
                 return await self._call_cloud_llm(prompt, max_tokens)
         return None
 
+    async def _call_llm_text_with_fallback(self, prompt: str, max_tokens: int, min_length: int) -> Optional[str]:
+        # Local-first to save cost, cloud fallback for weak/empty outputs.
+        text = await self._call_llm_text(prompt, max_tokens=max_tokens, prefer_cloud=False)
+        if not text or len(self._clean_text(text)) < min_length:
+            text = await self._call_llm_text(prompt, max_tokens=max_tokens, prefer_cloud=True)
+        return text
+
     def _clean_text(self, text: Optional[str]) -> str:
         if not text:
             return ""
         clean = text.strip()
-        clean = re.sub(r"^```[a-zA-Z]*\s*", "", clean)
-        clean = re.sub(r"\s*```$", "", clean)
+        clean = _FENCE_PREFIX_RE.sub("", clean)
+        clean = _FENCE_SUFFIX_RE.sub("", clean)
         return clean.strip().strip('"')
 
     def _extract_json_from_text(self, text: Optional[str]) -> Optional[Dict[str, Any]]:
         if not text:
             return None
         clean = text.strip()
-        # Try fenced blocks first
-        for match in re.finditer(r"```(?:json)?\s*([\s\S]*?)\s*```", clean, flags=re.IGNORECASE):
-            candidate = (match.group(1) or "").strip()
-            if not candidate:
-                continue
-            try:
-                return json.loads(candidate)
-            except json.JSONDecodeError:
-                continue
-
-        clean = re.sub(r"```json\s*|\s*```", "", clean, flags=re.IGNORECASE).strip()
+        # 没有代码块标记时（JSON 直接输出）跳过两次围栏正则扫描
+        if "```" in clean:
+            # Try fenced blocks first
+            for match in _FENCED_BLOCK_RE.finditer(clean):
+                candidate = (match.group(1) or "").strip()
+                if not candidate:
+                    continue
+                try:
+                    return fast_json_loads(candidate)
+                except json.JSONDecodeError:
+                    continue
+
+            clean = _FENCE_MARK_RE.sub("", clean).strip()
         try:
-            return json.loads(clean)
+            return fast_json_loads(clean)
         except json.JSONDecodeError:
             pass
 
@@ -280,72 +500,108 @@ class SummaryService:
         end = clean.rfind("}")
         if start != -1 and end != -1 and end > start:
             try:
-                return json.loads(clean[start : end + 1])
+                return fast_json_loads(clean[start : end + 1])
             except json.JSONDecodeError:
                 return None
         return None
     
-    async def _generate_summary_text(self, content_data: Dict[str, Any]) -> Dict[str, str]:
-        """生成摘要文本（简短和详细）"""
-        # 构建加权内容（字幕权重最高）
-        weighted_content = self._build_weighted_content(content_data)
-        
-        if not weighted_content:
+    async def _generate_summary_text(self, weighted_content: str) -> Dict[str, str]:
+        """生成摘要文本（简短和详细），weighted_content 为 _build_weighted_content 的结果"""
+        if len(weighted_content) < self.MIN_SUMMARY_CONTENT_LENGTH:
             return {"short": "", "detailed": ""}
         
-        # 限制总长度（避免超出模型算力）
-        max_total_length = 2500
-        if len(weighted_content) > max_total_length:
-            weighted_content = weighted_content[:max_total_length] + "..."
-        
         # 生成简短摘要（50-100字）
-        short_prompt = f"""请基于以下视频内容，生成一段50-100字的简短摘要，要求：
-1. 精炼概括视频核心内容
-2. 突出视频主题和要点
-3. 语言简洁流畅
-
-视频内容：
-{weighted_content}
-
-请只返回摘要文本，不要包含其他说明："""
+        short_prompt = _SHORT_SUMMARY_PROMPT.format(content=weighted_content)
         
         # 生成详细摘要（200-300字）
-        detailed_prompt = f"""请基于以下视频内容，生成一段200-300字的详细摘要，要求：
-1. 详细概括视频主要内容
-2. 包含关键信息和要点
-3. 语言流畅，结构清晰
-
-视频内容：
-{weighted_content}
-
-请只返回摘要文本，不要包含其他说明："""
+        detailed_prompt = _DETAILED_SUMMARY_PROMPT.format(content=weighted_content)
         
         try:
-            # Local-first to save cost, cloud fallback for weak/empty outputs.
-            short_text = await self._call_llm_text(short_prompt, max_tokens=256, prefer_cloud=False)
-            if not short_text or len(self._clean_text(short_text)) < 20:
-                short_text = await self._call_llm_text(short_prompt, max_tokens=256, prefer_cloud=True)
-
-            detailed_text = await self._call_llm_text(detailed_prompt, max_tokens=512, prefer_cloud=False)
-            if not detailed_text or len(self._clean_text(detailed_text)) < 40:
-                detailed_text = await self._call_llm_text(detailed_prompt, max_tokens=512, prefer_cloud=True)
-
-            short_summary = self._clean_text(short_text)
-            if len(short_summary) > 150:
-                short_summary = short_summary[:150] + "..."
+            # 简短摘要和详细摘要互不依赖，并发请求
+            short_text, detailed_text = await asyncio.gather(
+                self._call_llm_text_with_fallback(short_prompt, max_tokens=256, min_length=20),
+                self._call_llm_text_with_fallback(detailed_prompt, max_tokens=512, min_length=40),
+            )
 
-            detailed_summary = self._clean_text(detailed_text)
-            if len(detailed_summary) > 400:
-                detailed_summary = detailed_summary[:400] + "..."
-
-            return {"short": short_summary, "detailed": detailed_summary}
+            return self._finalize_summary(short_text, detailed_text)
             
         except Exception as e:
             logger.error(f"生成摘要文本失败: {e}")
             return {"short": "", "detailed": ""}
     
-    def _build_weighted_content(self, content_data: Dict[str, Any]) -> str:
-        """构建加权内容（字幕权重最高）"""
+    def _finalize_summary(self, short_text: Optional[str], detailed_text: Optional[str]) -> Dict[str, str]:
+        """清理摘要文本并限制长度"""
+        short_summary = self._clean_text(short_text)
+        if len(short_summary) > 150:
+            short_summary = short_summary[:150] + "..."
+
+        detailed_summary = self._clean_text(detailed_text)
+        if len(detailed_summary) > 400:
+            detailed_summary = detailed_summary[:400] + "..."
+
+        return {"short": short_summary, "detailed": detailed_summary}
+    
+    async def _generate_summary_and_knowledge(
+        self, weighted_content: str
+    ) -> Optional[Tuple[Dict[str, str], Dict[str, List[str]]]]:
+        """
+        一次 LLM 请求同时生成简短摘要、详细摘要和核心知识点
+        
+        三项任务基于同一段视频内容，合并后内容只需编码一次、只有一次网络往返。
+        每个可用的模型（本地优先，其次云端）最多请求一次。
+        返回 None 表示有模型响应但都没有给出可用的 JSON，由调用方回退到分开请求；
+        所有模型都没有响应时（服务不可用）分开请求同样会失败，直接返回空摘要和空知识点
+        """
+        if not weighted_content:
+            return None
+        
+        prompt = _FUSED_SUMMARY_PROMPT.format(content=weighted_content)
+        
+        llm_mode = getattr(settings, "LLM_MODE", "hybrid").lower()
+        # Local-first to save cost, cloud fallback for invalid/weak outputs.
+        backends = []
+        if llm_mode in ("local_only", "hybrid"):
+            backends.append(self._call_local_llm)
+        if llm_mode in ("cloud_only", "hybrid"):
+            backends.append(self._call_cloud_llm)
+        
+        responded = False
+        try:
+            for call_llm in backends:
+                response_text = await call_llm(prompt, 1280)
+                if not response_text:
+                    continue
+                responded = True
+                parsed = self._extract_json_from_text(response_text)
+                if not isinstance(parsed, dict):
+                    continue
+                short_text = parsed.get("short")
+                detailed_text = parsed.get("detailed")
+                if not isinstance(short_text, str) or not isinstance(detailed_text, str):
+                    continue
+                if len(self._clean_text(short_text)) < 20 or len(self._clean_text(detailed_text)) < 40:
+                    continue
+                return (
+                    self._finalize_summary(short_text, detailed_text),
+                    self._normalize_knowledge_points(parsed.get("knowledge_points")),
+                )
+        except Exception as e:
+            logger.error(f"合并生成摘要和知识点失败: {e}")
+        
+        if not responded:
+            logger.warning("合并请求没有任何模型响应，跳过分开生成摘要和知识点")
+            return self._finalize_summary(None, None), self._normalize_knowledge_points(None)
+        
+        logger.warning("合并请求未返回可用结果，回退到分开生成摘要和知识点")
+        return None
+    
+    def _build_weighted_content(self, content_data: Dict[str, Any], max_tokens: Optional[int] = None) -> str:
+        """
+        构建加权内容（字幕权重最高）
+        
+        max_tokens: 估算 token 数超过该预算时截断并追加 "..."；
+                    只拼接到预算可容纳的最大字符数为止，不构造完整的超长字符串
+        """
         parts = []
         
         # 字幕内容（权重最高，完整展示）
@@ -360,13 +616,29 @@ class SummaryService:
         if content_data.get("comment_text"):
             parts.append(f"【评论内容】（补充信息，共{content_data['comment_count']}条）\n{content_data['comment_text']}")
         
-        return "\n\n".join(parts)
-    
-    async def _extract_knowledge_points(self, content_data: Dict[str, Any]) -> Dict[str, List[str]]:
-        """提取核心知识点"""
-        weighted_content = self._build_weighted_content(content_data)
+        if max_tokens is None:
+            return "\n\n".join(parts)
         
-        if not weighted_content:
+        max_chars = max_chars_for_tokens(max_tokens)
+        taken = []
+        total = -2  # 第一段前没有分隔符
+        for part in parts:
+            taken.append(part)
+            total += len(part) + 2
+            if total > max_chars:
+                break
+        return self._truncate_to_tokens("\n\n".join(taken), max_tokens)
+    
+    def _truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """按估算 token 数截断，截断时追加 "..." """
+        truncated = truncate_to_token_budget(text, max_tokens)
+        if len(truncated) < len(text):
+            return truncated + "..."
+        return text
+    
+    async def _extract_knowledge_points(self, weighted_content: str) -> Dict[str, List[str]]:
+        """提取核心知识点，weighted_content 为 _build_weighted_content 的结果"""
+        if len(weighted_content) < self.MIN_KNOWLEDGE_CONTENT_LENGTH:
             return {
                 "concepts": [],
                 "steps": [],
@@ -375,28 +647,9 @@ class SummaryService:
             }
         
         # 限制长度
-        max_length = 2000
-        if len(weighted_content) > max_length:
-            weighted_content = weighted_content[:max_length] + "..."
+        weighted_content = self._truncate_to_tokens(weighted_content, self.MAX_KNOWLEDGE_CONTENT_TOKENS)
         
-        knowledge_prompt = f"""请基于以下视频内容，提取核心知识点，要求：
-1. **概念**：提取3-5个关键概念或术语
-2. **步骤**：提取3-5个关键步骤或流程（如果有）
-3. **数据**：提取3-5个关键数据、统计或事实（如果有）
-4. **观点**：提取3-5个重要观点或结论（如果有）
-
-视频内容：
-{weighted_content}
-
-请以严格的JSON格式返回（不要包含Markdown标记）：
-{{
-    "concepts": ["概念1", "概念2"],
-    "steps": ["步骤1", "步骤2"],
-    "data": ["数据1", "数据2"],
-    "opinions": ["观点1", "观点2"]
-}}
-
-如果某个类别没有相关内容，请返回空数组 []。"""
+        knowledge_prompt = _KNOWLEDGE_PROMPT.format(content=weighted_content)
         
         try:
             response_text = await self._call_llm_text(knowledge_prompt, max_tokens=512, prefer_cloud=False)
@@ -404,19 +657,7 @@ class SummaryService:
             if not knowledge_points:
                 response_text = await self._call_llm_text(knowledge_prompt, max_tokens=512, prefer_cloud=True)
                 knowledge_points = self._extract_json_from_text(response_text)
-            if isinstance(knowledge_points, dict):
-                return {
-                    "concepts": knowledge_points.get("concepts", [])[:5],
-                    "steps": knowledge_points.get("steps", [])[:5],
-                    "data": knowledge_points.get("data", [])[:5],
-                    "opinions": knowledge_points.get("opinions", [])[:5]
-                }
-            return {
-                "concepts": [],
-                "steps": [],
-                "data": [],
-                "opinions": []
-            }
+            return self._normalize_knowledge_points(knowledge_points)
             
         except Exception as e:
             logger.error(f"提取核心知识点失败: {e}")
@@ -427,25 +668,59 @@ class SummaryService:
                 "opinions": []
             }
     
+    def _normalize_knowledge_points(self, knowledge_points: Any) -> Dict[str, List[str]]:
+        """整理 LLM 返回的知识点：每类最多保留 5 条，格式不对时返回空分类"""
+        if isinstance(knowledge_points, dict):
+            return {
+                "concepts": knowledge_points.get("concepts", [])[:5],
+                "steps": knowledge_points.get("steps", [])[:5],
+                "data": knowledge_points.get("data", [])[:5],
+                "opinions": knowledge_points.get("opinions", [])[:5]
+            }
+        return {
+            "concepts": [],
+            "steps": [],
+            "data": [],
+            "opinions": []
+        }
+    
     def _save_summary_to_db(
         self,
         db: Session,
         video: Video,
         summary_result: Dict[str, str],
-        knowledge_points: Dict[str, List[str]]
+        knowledge_points: Dict[str, List[str]],
+        commit: bool = True
     ):
-        """保存摘要到数据库（使用独立字段）"""
+        """
+        保存摘要到数据库（使用独立字段）
+        
+        commit=False 时只执行 UPDATE，由会话的所有者提交或回滚（失败时异常抛给调用方）
+        """
+        video_id = video.id  # 提交后实例过期，提前取出，避免日志里访问属性触发重新查询
         try:
-            # 使用独立字段保存摘要和知识点
-            video.summary_short = summary_result.get("short", "")
-            video.summary_detailed = summary_result.get("detailed", "")
-            video.knowledge_points = knowledge_points  # JSON字段，直接保存字典
+            # 使用独立字段保存摘要和知识点：直接执行一条 UPDATE，不经过 ORM 的变更跟踪和 flush。
+            # 提交时会话中的实例统一过期，无需同步；不提交时同步更新会话中的 video 实例
+            db.execute(
+                update(Video)
+                .where(Video.id == video_id)
+                .values(
+                    summary_short=summary_result.get("short", ""),
+                    summary_detailed=summary_result.get("detailed", ""),
+                    knowledge_points=knowledge_points,  # JSON字段，直接保存字典
+                )
+                .execution_options(synchronize_session=False if commit else "auto")
+            )
             
-            db.commit()
-            logger.info(f"视频摘要已保存: video_id={video.id}")
+            if commit:
+                db.commit()
+            logger.info(f"视频摘要已保存: video_id={video_id}")
             
         except Exception as e:
             logger.error(f"保存视频摘要失败: {e}")
+            if not commit:
+                # 会话属于调用方：异常交给调用方回滚，不能吞掉后让调用方照常提交
+                raise
             db.rollback()
     
     async def _generate_structured_summary(self, content_data: Dict[str, Any]) -> Dict[str, str]:
@@ -464,26 +739,7 @@ class SummaryService:
                 "conclusions": ""
             }
         
-        prompt = f"""请基于以下视频内容，生成结构化摘要，包含以下四个部分：
-
-1. **问题背景**：视频要解决的核心问题或讨论的背景
-2. **研究方法**：视频中采用的研究方法、分析思路或技术手段
-3. **主要发现**：视频中发现的重要信息、数据或观点
-4. **最终结论**：视频得出的结论或总结
-
-请以JSON格式返回，格式如下：
-{{
-    "problem_background": "问题背景内容",
-    "research_methods": "研究方法内容",
-    "main_findings": "主要发现内容",
-    "conclusions": "最终结论内容"
-}}
-
-**重要：只返回JSON对象，不要包含任何Markdown标记或其他说明文字。**
-
-视频内容：
-{weighted_content}
-"""
+        prompt = _STRUCTURED_SUMMARY_PROMPT.format(content=weighted_content)
         
         try:
             response_text = await self._call_llm_text(prompt, max_tokens=1024, prefer_cloud=False)
@@ -499,7 +755,7 @@ class SummaryService:
                 elif "```" in cleaned_text:
                     cleaned_text = cleaned_text.split("```")[1].split("```")[0].strip()
                 
-                parsed = json.loads(cleaned_text)
+                parsed = fast_json_loads(cleaned_text)
                 return {
                     "problem_background": parsed.get("problem_background", "").strip(),
                     "research_methods": parsed.get("research_methods", "").strip(),
@@ -528,16 +784,9 @@ class SummaryService:
         }
         
         # 尝试匹配各个部分
-        patterns = {
-            "problem_background": [r"问题背景[：:]\s*(.+?)(?=\n|研究方法|主要发现|最终结论|$)", r"背景[：:]\s*(.+?)(?=\n|方法|发现|结论|$)"],
-            "research_methods": [r"研究方法[：:]\s*(.+?)(?=\n|主要发现|最终结论|问题背景|$)", r"方法[：:]\s*(.+?)(?=\n|发现|结论|背景|$)"],
-            "main_findings": [r"主要发现[：:]\s*(.+?)(?=\n|最终结论|问题背景|研究方法|$)", r"发现[：:]\s*(.+?)(?=\n|结论|背景|方法|$)"],
-            "conclusions": [r"最终结论[：:]\s*(.+?)(?=\n|问题背景|研究方法|主要发现|$)", r"结论[：:]\s*(.+?)(?=\n|背景|方法|发现|$)"]
-        }
-        
-        for key, pattern_list in patterns.items():
+        for key, pattern_list in _STRUCTURED_FIELD_RES.items():
             for pattern in pattern_list:
-                match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
+                match = pattern.search(text)
                 if match:
                     result[key] = match.group(1).strip()
                     break
@@ -5,11 +5,45 @@ JSON 处理工具函数
 """
 import json
 import logging
-from typing import Any, Optional, Dict
+from typing import Any, Optional, Dict, Union
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时回退到标准库
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
 
+def fast_json_loads(data: Union[str, bytes]) -> Any:
+    """
+    快速解析 JSON（已安装 orjson 时使用 C 实现，否则使用标准库 json）
+    
+    解析失败抛出的异常都是 json.JSONDecodeError 的子类，调用方按标准库方式捕获即可
+    
+    使用示例：
+        try:
+            data = fast_json_loads(response_text)
+        except json.JSONDecodeError:
+            ...
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def fast_json_dumps(obj: Any) -> bytes:
+    """
+    快速序列化为 UTF-8 编码的 JSON 字节串（已安装 orjson 时使用 C 实现，否则使用标准库 json）
+    
+    非 ASCII 字符直接按 UTF-8 输出（不转义为 \\uXXXX），适合作为 HTTP 请求体：
+        client.post(url, content=fast_json_dumps(payload), headers={"Content-Type": "application/json"})
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
 def safe_json_loads(
     json_str: Optional[str],
     default: Any = None
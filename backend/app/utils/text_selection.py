@@ -0,0 +1,137 @@
+"""
+抽取式文本压缩工具函数
+
+在 token 预算内挑选信息量最高的句子（而不是只保留开头），用于把长字幕压缩后交给 LLM
+
+打分规则（不依赖分词器和第三方库）：
+- 词项：ASCII 单词按整词计；中文等非 ASCII 文本没有空格分词，使用字符二元组（bigram）
+- 句子得分：句子 TF-IDF 向量与全文质心向量的余弦相似度，越接近全文主题得分越高
+- 按得分从高到低选句，直到用完 token 预算（按 token_utils 估算）；输出时恢复原始顺序
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, List
+
+from app.utils.token_utils import estimate_tokens, max_chars_for_tokens, truncate_to_token_budget
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def _sentence_terms(sentence: str) -> Counter:
+    """提取句子的词项计数"""
+    terms = Counter()
+    for word in _WORD_RE.findall(sentence.lower()):
+        if word.isascii() or len(word) == 1:
+            terms[word] += 1
+        else:
+            terms.update(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+
+def score_sentences(sentences: List[str]) -> List[float]:
+    """
+    计算每个句子与全文主题的相关度（TF-IDF 向量与质心的余弦相似度）
+
+    Args:
+        sentences: 句子列表
+
+    Returns:
+        List[float]: 与 sentences 一一对应的得分（0~1，没有词项的句子为 0）
+    """
+    term_counts = [_sentence_terms(sentence) for sentence in sentences]
+
+    # 文档频率 -> 平滑 IDF
+    document_frequency = Counter()
+    for counts in term_counts:
+        document_frequency.update(counts.keys())
+    total = len(sentences)
+    idf = {
+        term: math.log((1 + total) / (1 + df)) + 1.0
+        for term, df in document_frequency.items()
+    }
+
+    # 句子向量与质心（所有句子向量之和，方向与均值相同）
+    vectors: List[Dict[str, float]] = []
+    centroid: Dict[str, float] = {}
+    for counts in term_counts:
+        vector = {term: count * idf[term] for term, count in counts.items()}
+        vectors.append(vector)
+        for term, weight in vector.items():
+            centroid[term] = centroid.get(term, 0.0) + weight
+
+    centroid_norm = math.sqrt(sum(weight * weight for weight in centroid.values()))
+    if not centroid_norm:
+        return [0.0] * total
+
+    scores = []
+    for vector in vectors:
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        if not norm:
+            scores.append(0.0)
+            continue
+        dot = sum(weight * centroid[term] for term, weight in vector.items())
+        scores.append(dot / (norm * centroid_norm))
+    return scores
+
+
+def select_salient_text(sentences: List[str], max_tokens: int, separator: str = ' ') -> str:
+    """
+    在 token 预算内选出得分最高的句子，按原始顺序拼接
+
+    预算按 estimate_tokens 估算；逐句累加每句的估算值（各自向上取整），
+    因此结果的实际估算 token 数一定不超过预算
+
+    Args:
+        sentences: 句子列表（如字幕条目文本）
+        max_tokens: 结果的 token 预算（含分隔符）
+        separator: 句子之间的分隔符
+
+    Returns:
+        str: 拼接后的文本；全文未超预算时原样拼接返回
+    """
+    sentences = [sentence for sentence in sentences if sentence]
+    separator_cost = estimate_tokens(separator)
+
+    # 全文字符数不超过预算可容纳的最大字符数时才可能不超预算，此时才拼接全文估算
+    # （长视频的全文可能是预算的几十倍，超长时不拼接）
+    max_chars = max_chars_for_tokens(max_tokens)
+    total_length = sum(map(len, sentences)) + len(separator) * max(len(sentences) - 1, 0)
+    if total_length <= max_chars:
+        full_text = separator.join(sentences)
+        if estimate_tokens(full_text) <= max_tokens:
+            return full_text
+
+    scores = score_sentences(sentences)
+    # 得分相同时优先靠前的句子
+    ranked = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+
+    selected = []
+    seen = set()
+    used = 0
+    for index in ranked:
+        # 重复的句子（如反复出现的口头禅）只保留第一次，不占用预算
+        if sentences[index] in seen:
+            continue
+        cost = estimate_tokens(sentences[index]) + (separator_cost if selected else 0)
+        if used + cost > max_tokens:
+            continue
+        selected.append(index)
+        seen.add(sentences[index])
+        used += cost
+        if max_tokens - used <= separator_cost:
+            break
+
+    if not selected:
+        # 单句就超出预算：退回前缀截断（只拼接到足够长度为止）
+        head = []
+        head_length = 0
+        for sentence in sentences:
+            head.append(sentence)
+            head_length += len(sentence) + len(separator)
+            if head_length >= max_chars:
+                break
+        return truncate_to_token_budget(separator.join(head), max_tokens)
+
+    selected.sort()
+    return separator.join(sentences[index] for index in selected)
@@ -0,0 +1,69 @@
+"""
+Token 估算工具函数
+
+提供不依赖具体分词器的 token 数估算与按 token 预算截断
+
+估算规则（与 GLM / Qwen 系列分词器的经验值接近）：
+- 非 ASCII 字符（中文、日文等）：约 1 字 = 1 token
+- ASCII 字符（英文、数字、标点）：约 4 字符 = 1 token
+"""
+
+# 以 1/4 token 为单位计数，避免浮点运算
+_ASCII_COST = 1
+_NON_ASCII_COST = 4
+_UNITS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数
+    
+    Args:
+        text: 文本内容
+        
+    Returns:
+        int: 估算的 token 数（向上取整）
+    """
+    if not text:
+        return 0
+    if text.isascii():
+        units = len(text) * _ASCII_COST
+    else:
+        ascii_count = len(text.encode('ascii', 'ignore'))
+        units = ascii_count * _ASCII_COST + (len(text) - ascii_count) * _NON_ASCII_COST
+    return -(-units // _UNITS_PER_TOKEN)
+
+
+def max_chars_for_tokens(max_tokens: int) -> int:
+    """
+    token 预算最多能容纳的字符数（全部为 ASCII 时）
+    
+    超过该长度的部分一定会被 truncate_to_token_budget 截掉，拼接文本时可提前停止
+    """
+    return max_tokens * _UNITS_PER_TOKEN // _ASCII_COST
+
+
+def truncate_to_token_budget(text: str, max_tokens: int) -> str:
+    """
+    按估算 token 数截断文本，返回不超过预算的最长前缀
+    
+    Args:
+        text: 文本内容
+        max_tokens: token 预算
+        
+    Returns:
+        str: 截断后的文本（未超预算时原样返回）
+    """
+    # 快速路径：每个字符最多 1 token，长度不超过预算时一定不超
+    if len(text) <= max_tokens:
+        return text
+    budget = max_tokens * _UNITS_PER_TOKEN
+    if text.isascii():
+        return text[:budget // _ASCII_COST]
+    
+    used = 0
+    for index, char in enumerate(text):
+        used += _ASCII_COST if char < '\x80' else _NON_ASCII_COST
+        if used > budget:
+            return text[:index]
+    return text